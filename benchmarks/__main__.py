@@ -0,0 +1,200 @@
+"""Benchmark suite for core.database.
+
+For every size it seeds a temporary database, times every public Database
+method and the mixed workloads, then runs simulated reaction events through
+AsyncDatabase. Results are printed and written as JSON, which --compare
+diffs against an earlier report. Nothing touches the network or the bot's
+own database.
+
+Run from the repository root with ``python -m benchmarks``.
+"""
+import argparse
+import asyncio
+import inspect
+import os
+import random
+import sys
+import tempfile
+import time
+
+from core.async_database import AsyncDatabase
+from core.database import Database
+
+from . import report
+from .seed import MESSAGE_BASE, seed
+from .workloads import EXCLUDED, method_workloads, mixed_workloads
+
+# Reactions on messages the bot does not manage use ids from here
+UNMANAGED_BASE = MESSAGE_BASE * 2
+
+
+def run_workload(workload, iterations):
+    iterations = min(iterations, workload.iterations or iterations)
+    timings = []
+    elapsed = 0.0
+    for i in range(iterations):
+        if workload.setup is not None:
+            workload.setup(i)
+        start = time.perf_counter()
+        workload.call(i)
+        timing = time.perf_counter() - start
+        if workload.teardown is not None:
+            workload.teardown(i)
+        timings.append(timing)
+        elapsed += timing
+    return report.summarize(timings, elapsed)
+
+
+async def reaction_events(db, dataset, events, concurrency):
+    # What the reaction listeners ask the database per event, with one in
+    # ten events also changing a reaction through the write queue
+    pick = random.Random(2)
+    timings = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def event(i):
+        async with semaphore:
+            start = time.perf_counter()
+            config = await db.get_reaction_config(
+                dataset.message_id(pick.randrange(dataset.messages))
+            )
+            if config.exists:
+                await db.notify(config.guild_id)
+            if i % 10 == 0:
+                await db.add_reaction(dataset.message_id(i), 1, f"event{i}")
+            timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(event(i) for i in range(events)))
+    elapsed = time.perf_counter() - start
+    await db.flush()
+    return report.summarize(timings, elapsed)
+
+
+async def listener_events(db, dataset, events, managed_share, filtered):
+    # The listeners' first step for every reaction, where only
+    # ``managed_share`` of the reactions are on reaction-role messages
+    pick = random.Random(3)
+    message_ids = [
+        dataset.message_id(pick.randrange(dataset.messages))
+        if pick.random() < managed_share
+        else UNMANAGED_BASE + i
+        for i in range(events)
+    ]
+    timings = []
+    start = time.perf_counter()
+    for message_id in message_ids:
+        event_start = time.perf_counter()
+        if not filtered or db.manages(message_id):
+            await db.get_reaction_config(message_id)
+        timings.append(time.perf_counter() - event_start)
+    return report.summarize(timings, time.perf_counter() - start)
+
+
+def uncovered(workloads):
+    public = {
+        name
+        for name, _ in inspect.getmembers(Database, inspect.isfunction)
+        if not name.startswith("_")
+    }
+    return sorted(public - set(EXCLUDED) - {workload.name for workload in workloads})
+
+
+def run_size(size, args):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        archive = os.path.join(directory, "archive.db")
+        start = time.perf_counter()
+        dataset = seed(path, size)
+        print(
+            f"Seeded {dataset.rows} rows, {dataset.messages} messages and"
+            f" {dataset.guilds} guilds in {time.perf_counter() - start:.1f}s",
+            file=sys.stderr,
+        )
+
+        db = Database(path, use_index=not args.no_index, archive=archive)
+        workloads = method_workloads(db, dataset) + mixed_workloads(db, dataset)
+        missing = uncovered(workloads)
+        if missing:
+            print(f"Not benchmarked: {', '.join(missing)}", file=sys.stderr)
+
+        for workload in workloads:
+            if args.only and workload.name not in args.only:
+                continue
+            results[workload.name] = run_workload(workload, args.iterations)
+        db.close()
+
+        async_workloads = {
+            "async_reaction_events": lambda db: reaction_events(
+                db, dataset, args.events, args.concurrency
+            ),
+            "async_listener_unfiltered": lambda db: listener_events(
+                db, dataset, args.events, args.managed_share, filtered=False
+            ),
+            "async_listener_filtered": lambda db: listener_events(
+                db, dataset, args.events, args.managed_share, filtered=True
+            ),
+        }
+        for name, workload in async_workloads.items():
+            if args.only and name not in args.only:
+                continue
+            db = AsyncDatabase(path, archive=archive)
+            if args.no_index:
+                db.sync.index = None
+            try:
+                results[name] = asyncio.run(workload(db))
+            finally:
+                db.close()
+
+    return results
+
+
+def main(args):
+    results = {}
+    for size in args.sizes:
+        results[str(size)] = run_size(size, args)
+        report.print_results(size, results[str(size)])
+
+    settings = {
+        "sizes": args.sizes,
+        "iterations": args.iterations,
+        "events": args.events,
+        "concurrency": args.concurrency,
+        "managed_share": args.managed_share,
+        "index": not args.no_index,
+    }
+    new = report.build(results, settings)
+    report.write(new, args.output)
+    print(f"\nWrote {args.output}", file=sys.stderr)
+    if args.compare:
+        report.print_comparison(report.load(args.compare), new)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="reaction-role rows to seed, 1000000 works too but takes a while",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--managed-share",
+        type=float,
+        default=0.05,
+        help="share of the simulated reactions that are on reaction-role messages",
+    )
+    parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="disable the in-memory index so every lookup reaches SQLite",
+    )
+    parser.add_argument("--only", nargs="+", help="run just these workloads")
+    parser.add_argument("--output", default="benchmark-report.json")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    main(parser.parse_args())
@@ -0,0 +1,149 @@
+"""Per-call latency of every public Database method with and without pooling.
+
+Run from the repository root with ``python -m benchmarks.connection_pool``.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from core.database import Database
+from core.pool import ConnectionPool
+
+from .seed import seed
+
+
+class OneShotPool(ConnectionPool):
+    # Mirrors the old behaviour: a fresh default connection for every call
+
+    @contextmanager
+    def reader(self):
+        conn = sqlite3.connect(self.database)
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            conn.close()
+
+    @contextmanager
+    def writer(self):
+        conn = sqlite3.connect(self.database)
+        cursor = conn.cursor()
+        try:
+            yield cursor
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+
+class OneShotDatabase(Database):
+    pool_class = OneShotPool
+
+    def __init__(self, database):
+        super().__init__(database, use_index=False)
+
+
+class UnindexedDatabase(Database):
+    # Keeps the comparison about connections rather than the index
+    def __init__(self, database):
+        super().__init__(database, use_index=False)
+
+
+# Guild 1 of the seeded file, with admins, settings and messages in channel 10
+GUILD_ID = 1
+CHANNEL_ID = 10
+
+
+def calls(db, dataset):
+    # (name, callable taking the iteration number)
+    message_id = dataset.message_id
+    return [
+        ("exists", lambda i: db.exists(message_id(i))),
+        ("get_reactions", lambda i: db.get_reactions(message_id(i))),
+        ("isunique", lambda i: db.isunique(message_id(i))),
+        ("get_reaction_config", lambda i: db.get_reaction_config(message_id(i))),
+        ("notify", lambda i: db.notify(GUILD_ID)),
+        ("get_admins", lambda i: db.get_admins(GUILD_ID)),
+        ("fetch_systemchannel", lambda i: db.fetch_systemchannel(GUILD_ID)),
+        ("fetch_messages", lambda i: db.fetch_messages(CHANNEL_ID)),
+        ("fetch_cleanup_guilds", lambda i: db.fetch_cleanup_guilds()),
+        ("fetch_all_guilds", lambda i: db.fetch_all_guilds()),
+        ("fetch_all_messages", lambda i: db.fetch_all_messages()),
+        (
+            "add_reaction_role",
+            lambda i: db.add_reaction_role(
+                {
+                    "message": {
+                        "message_id": 10 ** 9 + i,
+                        "channel_id": CHANNEL_ID + 1,
+                        "guild_id": GUILD_ID + 1,
+                    },
+                    "limit_to_one": 0,
+                    "reactions": {"🔥": 102},
+                }
+            ),
+        ),
+        ("add_reaction", lambda i: db.add_reaction(message_id(i), 103, f"r{i}")),
+        ("remove_reaction", lambda i: db.remove_reaction(message_id(i), f"r{i}")),
+        ("delete", lambda i: db.delete(10 ** 9 + i)),
+        ("add_admin", lambda i: db.add_admin(1000 + i, GUILD_ID)),
+        ("remove_admin", lambda i: db.remove_admin(1000 + i, GUILD_ID)),
+        ("add_systemchannel", lambda i: db.add_systemchannel(GUILD_ID, CHANNEL_ID)),
+        ("toggle_notify", lambda i: db.toggle_notify(GUILD_ID)),
+        ("add_guild", lambda i: db.add_guild(CHANNEL_ID, GUILD_ID)),
+        ("add_cleanup_guild", lambda i: db.add_cleanup_guild(2000 + i, 0)),
+        ("remove_cleanup_guild", lambda i: db.remove_cleanup_guild(2000 + i)),
+        ("remove_guild", lambda i: db.remove_guild(3000 + i)),
+    ]
+
+
+def measure(database_class, path, messages, iterations):
+    dataset = seed(path, messages * 2, reactions_per_message=2)
+    db = database_class(path)
+    results = {}
+    for name, call in calls(db, dataset):
+        timings = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            call(i)
+            timings.append(time.perf_counter() - start)
+        results[name] = statistics.median(timings) * 1e6
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        before = measure(
+            OneShotDatabase,
+            os.path.join(directory, "before.db"),
+            args.messages,
+            args.iterations,
+        )
+        after = measure(
+            UnindexedDatabase,
+            os.path.join(directory, "after.db"),
+            args.messages,
+            args.iterations,
+        )
+
+    print(f"{'method':<22}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name in before:
+        print(
+            f"{name:<22}{before[name]:>14.1f}{after[name]:>14.1f}"
+            f"{before[name] / after[name]:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Event-loop lag while reaction handlers query the database.
+
+A ticker coroutine wakes up every millisecond and records how late it was
+scheduled while simulated reaction events run the listener's queries,
+once calling Database directly on the loop and once through AsyncDatabase.
+A background thread keeps the writer busy, as cleandb would.
+
+Run from the repository root with ``python -m benchmarks.event_loop_lag``.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from core.async_database import AsyncDatabase
+
+from .report import percentile
+from .seed import seed
+
+TICK = 0.001
+
+
+def background_writes(db, guild_id, stop):
+    i = 0
+    while not stop.is_set():
+        db.add_admin(i, guild_id)
+        db.remove_admin(i, guild_id)
+        i += 1
+
+
+async def ticker(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def handle_sync(db, message_id, guild_id):
+    db.exists(message_id)
+    db.get_reactions(message_id)
+    db.isunique(message_id)
+    db.notify(guild_id)
+
+
+async def handle_async(db, message_id, guild_id):
+    await db.exists(message_id)
+    await db.get_reactions(message_id)
+    await db.isunique(message_id)
+    await db.notify(guild_id)
+
+
+async def run(db, handler, events, dataset):
+    lags = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            handler(db, dataset.message_id(i), dataset.guild_id(i))
+            for i in range(events)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    return elapsed, lags
+
+
+def report(name, elapsed, lags, events):
+    lags = sorted(lags) or [0.0]
+    p99 = percentile(lags, 0.99)
+    print(
+        f"{name:<8}{events / elapsed:>12.0f}{statistics.mean(lags) * 1e3:>12.2f}"
+        f"{p99 * 1e3:>12.2f}{lags[-1] * 1e3:>12.2f}"
+    )
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "lag.db")
+        dataset = seed(path, args.messages * 2, reactions_per_message=2)
+        db = AsyncDatabase(path)
+
+        # A guild without rows, so the writes leave the seeded admins alone
+        stop = threading.Event()
+        writer = threading.Thread(
+            target=background_writes, args=(db.sync, dataset.guilds + 1, stop)
+        )
+        writer.start()
+        try:
+            print(
+                f"{'mode':<8}{'events/s':>12}{'mean (ms)':>12}"
+                f"{'p99 (ms)':>12}{'max (ms)':>12}"
+            )
+            elapsed, lags = await run(db.sync, handle_sync, args.events, dataset)
+            report("sync", elapsed, lags, args.events)
+            elapsed, lags = await run(db, handle_async, args.events, dataset)
+            report("async", elapsed, lags, args.events)
+        finally:
+            stop.set()
+            writer.join()
+            db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""Query latency per Database method before and after the v4 indexes.
+
+Seeds a schema v3 database with 100k messages and 1M reaction rows,
+measures every lookup, applies SchemaHandler.three_to_four and measures
+again. The in-memory index is disabled so every call reaches SQLite.
+
+Run from the repository root with ``python -m benchmarks.indexes``.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from core.database import Database
+from core.schema import SchemaHandler
+
+from .seed import seed
+
+
+def calls(db, dataset, deleted):
+    pick = random.Random(0)
+
+    def message_id(_):
+        return dataset.message_id(pick.randrange(dataset.messages - deleted))
+
+    def channel_id(_):
+        return dataset.channel_id(pick.randrange(dataset.messages))
+
+    def guild_id(_):
+        return dataset.guild_id(pick.randrange(dataset.guilds))
+
+    return [
+        ("exists", lambda i: db.exists(message_id(i))),
+        ("get_reactions", lambda i: db.get_reactions(message_id(i))),
+        ("isunique", lambda i: db.isunique(message_id(i))),
+        ("get_reaction_config", lambda i: db.get_reaction_config(message_id(i))),
+        ("fetch_messages", lambda i: db.fetch_messages(channel_id(i))),
+        ("get_admins", lambda i: db.get_admins(guild_id(i))),
+        ("add_reaction", lambda i: db.add_reaction(message_id(i), 1, f"new{i}")),
+        ("remove_reaction", lambda i: db.remove_reaction(message_id(i), f"new{i}")),
+        (
+            "delete",
+            lambda i: db.delete(dataset.message_id(dataset.messages - 1 - deleted - i)),
+        ),
+        # Guilds without rows
+        ("remove_guild", lambda i: db.remove_guild(dataset.guilds + 1 + i)),
+    ]
+
+
+def measure(path, dataset, iterations, deleted=0):
+    # ``deleted`` messages at the end are gone after an earlier run
+    db = Database(path, use_index=False)
+    results = {}
+    for name, call in calls(db, dataset, deleted):
+        timings = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            call(i)
+            timings.append(time.perf_counter() - start)
+        results[name] = statistics.median(timings) * 1e6
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--reactions", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "indexes.db")
+        dataset = seed(
+            path, args.messages * args.reactions, args.reactions, version=3
+        )
+        before = measure(path, dataset, args.iterations)
+        start = time.perf_counter()
+        handler = SchemaHandler(path, None)
+        handler.migrate(until=4)
+        handler.close()
+        migration = time.perf_counter() - start
+        after = measure(path, dataset, args.iterations, deleted=args.iterations)
+
+    print(f"three_to_four took {migration:.2f}s")
+    print(f"{'method':<22}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name in before:
+        print(
+            f"{name:<22}{before[name]:>14.1f}{after[name]:>14.1f}"
+            f"{before[name] / after[name]:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
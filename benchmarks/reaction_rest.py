@@ -0,0 +1,454 @@
+"""REST calls the reaction listeners make, counted against a simulated gateway.
+
+Drives the raw reaction listeners of ReactionRolesEvents with payloads for a
+seeded database, each event in a task of its own like discord.py dispatches
+them, arriving at ``--rate`` events per second. Guilds, channels, messages
+and members are in-memory stand-ins that count every call which would be
+an HTTP request in discord.py, and a reaction the bot removes is fed back as
+the remove event Discord would send. Nothing connects to Discord.
+
+``--latency``, ``--guild-rate`` and ``--global-rate`` make those calls take
+time and wait like rate-limited requests do, and ``--hot-share`` sends part
+of the events to one giveaway message, to time the listeners of the other
+guilds while one guild is busy.
+
+Run from the repository root with ``python -m benchmarks.reaction_rest``.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from cogs.reaction_roles.reaction_roles_event import ReactionRolesEvents
+from core.async_database import AsyncDatabase
+
+from .report import percentile
+from .seed import MESSAGE_BASE, REACTIONS_PER_MESSAGE, reaction, seed
+
+BOT_ID = 1
+USER_BASE = 10**15
+EVERYONE_BASE = 10**14
+HOT_USER_BASE = 2 * 10**15
+UNMAPPED = "❓"
+# Members per page of Reaction.users()
+USERS_PAGE = 100
+
+
+class Role:
+    def __init__(self, role_id):
+        self.id = role_id
+        self.name = f"role{role_id}"
+
+
+class User:
+    def __init__(self, gateway, user_id):
+        self.gateway = gateway
+        self.id = user_id
+        self.bot = user_id == BOT_ID
+
+    async def send(self, content=None, **kwargs):
+        await self.gateway.request("send")
+
+
+class Member(User):
+    def __init__(self, gateway, guild, user_id):
+        super().__init__(gateway, user_id)
+        self.guild = guild
+        # Like discord.py, roles starts with the guild's @everyone role
+        self.roles = [guild.default_role]
+
+    @property
+    def _roles(self):
+        # The role ids discord.py keeps, without @everyone
+        return [role.id for role in self.roles[1:]]
+
+    async def add_roles(self, *roles, reason=None):
+        await self.gateway.request("add_roles", self.guild.id)
+        self.roles += [role for role in roles if role not in self.roles]
+
+    async def remove_roles(self, *roles, reason=None):
+        await self.gateway.request("remove_roles", self.guild.id)
+        self.roles = [role for role in self.roles if role not in roles]
+
+    async def edit(self, *, roles=None, reason=None):
+        await self.gateway.request("member_edit", self.guild.id)
+        if roles is not None:
+            self.roles = [self.guild.default_role] + list(roles)
+
+
+class Guild:
+    def __init__(self, gateway, guild_id):
+        self.gateway = gateway
+        self.id = guild_id
+        # Kept apart from the seeded role ids, which start at 1 in every guild
+        self.default_role = Role(EVERYONE_BASE + guild_id)
+        self.roles = [self.default_role] + [
+            Role(j + 1) for j in range(REACTIONS_PER_MESSAGE)
+        ]
+        self.system_channel = None
+        self.members = {}
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def member(self, user_id):
+        if user_id not in self.members:
+            self.members[user_id] = Member(self.gateway, self, user_id)
+        return self.members[user_id]
+
+    def get_member(self, user_id):
+        # Members are only cached once they have reacted before
+        return self.members.get(user_id)
+
+    async def fetch_member(self, user_id):
+        await self.gateway.request("fetch_member")
+        return self.member(user_id)
+
+
+class Reaction:
+    def __init__(self, message, emoji):
+        self.message = message
+        self.emoji = emoji
+
+    @property
+    def count(self):
+        return len(self.message.state[self.emoji])
+
+    async def users(self, limit=None, after=None):
+        # Sorted by id like Discord returns them
+        users = sorted(self.message.state[self.emoji])
+        if after is not None:
+            users = [user_id for user_id in users if user_id > after.id]
+        users = users[:limit]
+        for start in range(0, max(len(users), 1), USERS_PAGE):
+            await self.message.gateway.request("reaction_users")
+            for user_id in users[start : start + USERS_PAGE]:
+                yield SimpleNamespace(id=user_id)
+
+
+class PartialMessage:
+    def __init__(self, gateway, channel, message_id):
+        self.gateway = gateway
+        self.channel = channel
+        self.id = message_id
+
+    async def remove_reaction(self, emoji, member):
+        await self.gateway.request("remove_reaction")
+        # Takes a Reaction as well as an emoji, like discord.py
+        emoji = getattr(emoji, "emoji", emoji)
+        self.gateway.remove(self.channel, self.id, str(emoji), member.id)
+
+
+class Message(PartialMessage):
+    @property
+    def state(self):
+        return self.gateway.reactions[self.id]
+
+    @property
+    def reactions(self):
+        return [
+            Reaction(self, emoji) for emoji, users in self.state.items() if users
+        ]
+
+
+class Channel:
+    def __init__(self, gateway, channel_id, guild):
+        self.gateway = gateway
+        self.id = channel_id
+        self.guild = guild
+        self.mention = f"<#{channel_id}>"
+
+    def get_partial_message(self, message_id):
+        return PartialMessage(self.gateway, self, message_id)
+
+    async def fetch_message(self, message_id):
+        await self.gateway.request("fetch_message")
+        return Message(self.gateway, self, message_id)
+
+    async def send(self, content=None, **kwargs):
+        await self.gateway.request("send")
+
+
+class Gateway:
+    """Stands in for the bot: the caches the listeners read and the events
+    Discord would dispatch."""
+
+    def __init__(self, db, dataset, args, pick):
+        self.db = db
+        self.args = args
+        self.user = SimpleNamespace(id=BOT_ID)
+        self.rest = collections.Counter()
+        self.buckets = {}
+        self.latencies = collections.defaultdict(list)
+        self.guilds = {}
+        self.channels = {}
+        self.message_channels = {}
+        self.reactions = collections.defaultdict(lambda: collections.defaultdict(set))
+        self.cached_messages = []
+        self.listeners = {}
+        self.tasks = set()
+        # The giveaway message of --hot-share, not limit-to-one
+        self.hot_message = dataset.message_id(0)
+
+        for i in range(dataset.messages):
+            guild_id = dataset.guild_id(i)
+            if guild_id not in self.guilds:
+                self.guilds[guild_id] = Guild(self, guild_id)
+            channel_id = dataset.channel_id(i)
+            if channel_id not in self.channels:
+                self.channels[channel_id] = Channel(
+                    self, channel_id, self.guilds[guild_id]
+                )
+            channel = self.channels[channel_id]
+            self.message_channels[dataset.message_id(i)] = channel
+            if pick.random() < args.cached_share:
+                self.cached_messages.append(
+                    Message(self, channel, dataset.message_id(i))
+                )
+
+    async def request(self, name, guild_id=None):
+        # Counts the call and, with --guild-rate and --global-rate, waits for
+        # its turn like discord.py waits out rate limits. Role edits share a
+        # bucket per guild.
+        self.rest[name] += 1
+        if guild_id is not None and self.args.guild_rate:
+            await self.throttle(("guild", guild_id), self.args.guild_rate)
+        if self.args.global_rate:
+            await self.throttle("global", self.args.global_rate)
+        if self.args.latency:
+            await asyncio.sleep(self.args.latency / 1e3)
+
+    async def throttle(self, bucket, rate):
+        loop = asyncio.get_running_loop()
+        if bucket not in self.buckets:
+            self.buckets[bucket] = [asyncio.Lock(), 0.0]
+        state = self.buckets[bucket]
+        # state[1] is when the bucket allows the next call
+        async with state[0]:
+            delay = state[1] - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            state[1] = loop.time() + 1 / rate
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_user(self, user_id):
+        return User(self, user_id)
+
+    async def fetch_channel(self, channel_id):
+        await self.request("fetch_channel")
+        return self.channels[channel_id]
+
+    async def fetch_guild(self, guild_id):
+        await self.request("fetch_guild")
+        return self.guilds[guild_id]
+
+    def payload(self, channel, message_id, emoji, user_id, member):
+        return SimpleNamespace(
+            message_id=message_id,
+            channel_id=channel.id,
+            guild_id=channel.guild.id,
+            user_id=user_id,
+            emoji=emoji,
+            member=member,
+        )
+
+    async def timed(self, listener, payload):
+        # Time until the listener is done, roles applied, per kind of message
+        hot_guild = self.message_channels[self.hot_message].guild.id
+        if payload.message_id == self.hot_message:
+            label = "hot message"
+        elif payload.message_id not in self.message_channels:
+            label = None
+        elif payload.guild_id == hot_guild:
+            label = "hot guild, others"
+        else:
+            label = "other guilds"
+        start = time.perf_counter()
+        await listener(payload)
+        if label is not None:
+            self.latencies[label].append(time.perf_counter() - start)
+
+    def dispatch(self, kind, payload):
+        task = asyncio.get_running_loop().create_task(
+            self.timed(self.listeners[kind], payload)
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def add(self, channel, message_id, emoji, user_id):
+        self.reactions[message_id][emoji].add(user_id)
+        member = channel.guild.member(user_id)
+        self.dispatch("add", self.payload(channel, message_id, emoji, user_id, member))
+
+    def remove(self, channel, message_id, emoji, user_id):
+        if user_id not in self.reactions[message_id][emoji]:
+            return
+        self.reactions[message_id][emoji].discard(user_id)
+        # Remove events carry no member
+        self.dispatch("remove", self.payload(channel, message_id, emoji, user_id, None))
+
+
+async def drive(gateway, dataset, args, pick):
+    cog = gateway.cog = ReactionRolesEvents(gateway)
+    gateway.listeners = {
+        "add": cog.on_raw_reaction_add,
+        "remove": cog.on_raw_reaction_remove,
+    }
+    interval = 1 / args.rate if args.rate else 0
+    channels = list(gateway.channels.values())
+    for i in range(args.events):
+        if pick.random() < args.hot_share:
+            # Every user reacts once
+            channel = gateway.message_channels[gateway.hot_message]
+            gateway.add(channel, gateway.hot_message, reaction(0), HOT_USER_BASE + i)
+            await asyncio.sleep(interval)
+            continue
+
+        if pick.random() < args.managed_share:
+            message_id = dataset.message_id(pick.randrange(dataset.messages))
+            channel = gateway.message_channels[message_id]
+            if pick.random() < 0.9:
+                emoji = reaction(pick.randrange(REACTIONS_PER_MESSAGE))
+            else:
+                emoji = UNMAPPED
+        else:
+            channel = pick.choice(channels)
+            message_id = MESSAGE_BASE * 2 + i
+            emoji = UNMAPPED
+
+        user_id = USER_BASE + pick.randrange(args.users)
+        # Reacting twice with the same emoji takes the reaction back
+        if user_id in gateway.reactions[message_id][emoji]:
+            gateway.remove(channel, message_id, emoji, user_id)
+        else:
+            gateway.add(channel, message_id, emoji, user_id)
+        await asyncio.sleep(interval)
+
+    # Including the events the listeners cause themselves
+    while gateway.tasks:
+        await asyncio.gather(*gateway.tasks)
+
+
+async def run(args, path):
+    db = AsyncDatabase(path)
+    pick = random.Random(4)
+    dataset = args.dataset
+    gateway = Gateway(db, dataset, args, pick)
+    start = time.perf_counter()
+    try:
+        await drive(gateway, dataset, args, pick)
+        await db.flush()
+    finally:
+        db.close()
+    return gateway, time.perf_counter() - start
+
+
+def limit_to_one_violations(gateway, dataset):
+    # Users left with more than one mapped reaction on a limit-to-one message,
+    # the seed makes every other message one
+    violations = 0
+    for i in range(1, dataset.messages, 2):
+        held = collections.Counter()
+        for emoji, users in gateway.reactions[dataset.message_id(i)].items():
+            if emoji != UNMAPPED:
+                held.update(users)
+        violations += sum(1 for count in held.values() if count > 1)
+    return violations
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        args.dataset = seed(path, args.rows)
+        gateway, elapsed = asyncio.run(run(args, path))
+        rest = gateway.rest
+
+    print(
+        f"{args.events} reaction events, {args.managed_share:.0%} on reaction-role"
+        f" messages, {args.cached_share:.0%} of those cached, in {elapsed:.2f}s",
+        file=sys.stderr,
+    )
+    scale = 1000 / args.events
+    print(f"\n{'REST call':<24}{'per 1,000 events':>18}")
+    for name, count in sorted(rest.items()):
+        print(f"{name:<24}{count * scale:>18.1f}")
+    print(f"{'total':<24}{sum(rest.values()) * scale:>18.1f}")
+
+    if gateway.latencies:
+        print(f"\n{'listener latency':<24}{'p50 (ms)':>12}{'p99 (ms)':>12}{'max (ms)':>12}")
+    for label, timings in sorted(gateway.latencies.items()):
+        timings.sort()
+        print(
+            f"{label:<24}{percentile(timings, 0.5) * 1e3:>12.1f}"
+            f"{percentile(timings, 0.99) * 1e3:>12.1f}{timings[-1] * 1e3:>12.1f}"
+        )
+
+    for name in ("locks", "role_edits", "role_scheduler"):
+        component = getattr(gateway.cog, name, None)
+        if component is not None:
+            print(
+                f"\n{name}: "
+                + ", ".join(f"{key}={value:g}" for key, value in component.stats().items())
+            )
+    violations = limit_to_one_violations(gateway, args.dataset)
+    if violations:
+        print(f"\n{violations} users hold several reactions on limit-to-one messages")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.reaction_rest", description=__doc__
+    )
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument(
+        "--managed-share",
+        type=float,
+        default=0.5,
+        help="share of the reactions that are on reaction-role messages",
+    )
+    parser.add_argument(
+        "--cached-share",
+        type=float,
+        default=0.5,
+        help="share of the reaction-role messages in the bot's message cache",
+    )
+    parser.add_argument("--users", type=int, default=200, help="users per guild")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=500,
+        help="reaction events per second, 0 sends them as fast as possible",
+    )
+    parser.add_argument(
+        "--hot-share",
+        type=float,
+        default=0.0,
+        help="share of the events that are new users reacting to one giveaway message",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="milliseconds every REST call takes"
+    )
+    parser.add_argument(
+        "--guild-rate",
+        type=float,
+        default=0.0,
+        help="role edits per second a guild allows, 0 for no limit",
+    )
+    parser.add_argument(
+        "--global-rate",
+        type=float,
+        default=0.0,
+        help="REST calls per second the bot may make, 0 for no limit",
+    )
+    main(parser.parse_args())
@@ -0,0 +1,134 @@
+"""Read latency while a bulk guild purge holds the writer.
+
+Seeds a database, then queues AsyncDatabase.remove_guilds over half of the
+guilds while the event loop keeps awaiting the lookups the reaction
+listeners make, like the bot does. Done on a rollback journal, on WAL with
+the write batches sharing the read thread, and on WAL with the writer
+thread AsyncDatabase uses. The in-memory index is disabled so every call
+reaches SQLite.
+
+Run from the repository root with ``python -m benchmarks.read_latency``.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from core.async_database import AsyncDatabase
+from core.database import Database
+from core.pool import PRAGMAS, ConnectionPool
+
+from .report import percentile
+from .seed import seed
+
+
+class RollbackPool(ConnectionPool):
+    # The pool without WAL: readers wait whenever the purge holds the lock
+
+    def connect(self, *pragmas):
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        for pragma in PRAGMAS + pragmas:
+            if "journal_mode" not in pragma:
+                conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+
+class RollbackDatabase(Database):
+    pool_class = RollbackPool
+
+
+class RollbackAsyncDatabase(AsyncDatabase):
+    database_class = RollbackDatabase
+
+
+class SharedThreadDatabase(AsyncDatabase):
+    # Write batches queued behind the reads on one thread
+
+    async def run_write(self, func, *args, **kwargs):
+        return await self.run(func, *args, **kwargs)
+
+
+def prepare(path, args, db_class):
+    dataset = seed(path, args.messages * args.reactions, args.reactions)
+    if db_class is RollbackAsyncDatabase:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode = DELETE;")
+        conn.close()
+    return dataset
+
+
+async def purge(db, dataset):
+    start = time.perf_counter()
+    await db.remove_guilds(range(1, dataset.guilds + 1, 2))
+    return time.perf_counter() - start
+
+
+async def measure(path, dataset, db_class):
+    db = db_class(path)
+    db.sync.index = None
+    pick = random.Random(0)
+    # The purge takes the odd guilds, lookups go to the messages it leaves
+    survivors = [i for i in range(dataset.messages) if dataset.guild_id(i) % 2 == 0]
+
+    def message_id():
+        return dataset.message_id(pick.choice(survivors))
+
+    calls = [
+        lambda: db.exists(message_id()),
+        lambda: db.get_reactions(message_id()),
+        lambda: db.get_reaction_config(message_id()),
+        lambda: db.fetch_messages(dataset.channel_id(pick.choice(survivors))),
+        lambda: db.get_admins(dataset.guild_id(pick.randrange(dataset.guilds))),
+    ]
+    timings = []
+    errors = 0
+    writer = asyncio.ensure_future(purge(db, dataset))
+    # Lets the write queue pick the purge up first
+    await asyncio.sleep(0.01)
+    while not writer.done():
+        call = calls[len(timings) % len(calls)]
+        start = time.perf_counter()
+        if isinstance(await call(), Exception):
+            errors += 1
+        timings.append(time.perf_counter() - start)
+    elapsed = await writer
+    await db.flush()
+    db.close()
+
+    timings.sort()
+    return elapsed, len(timings), errors, timings
+
+
+def main(args):
+    print(
+        f"{'writes':<16}{'purge (s)':>10}{'reads':>10}{'errors':>8}"
+        f"{'p50 (us)':>12}{'p99 (us)':>12}{'max (ms)':>12}"
+    )
+    for name, db_class in (
+        ("rollback", RollbackAsyncDatabase),
+        ("wal, shared", SharedThreadDatabase),
+        ("wal, writer", AsyncDatabase),
+    ):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "purge.db")
+            dataset = prepare(path, args, db_class)
+            elapsed, reads, errors, timings = asyncio.run(
+                measure(path, dataset, db_class)
+            )
+        print(
+            f"{name:<16}{elapsed:>10.2f}{reads:>10}{errors:>8}"
+            f"{percentile(timings, 0.5) * 1e6:>12.0f}"
+            f"{percentile(timings, 0.99) * 1e6:>12.0f}{timings[-1] * 1e3:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--reactions", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,95 @@
+"""JSON reports of a suite run and comparisons between two of them."""
+import datetime
+import json
+import platform
+import sqlite3
+import subprocess
+
+REPORT_VERSION = 1
+
+
+def percentile(timings, fraction):
+    # timings must be sorted
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def summarize(timings, elapsed):
+    timings = sorted(timings)
+    return {
+        "iterations": len(timings),
+        "ops_per_s": len(timings) / elapsed if elapsed else 0.0,
+        "mean_us": sum(timings) / len(timings) * 1e6,
+        "p50_us": percentile(timings, 0.5) * 1e6,
+        "p99_us": percentile(timings, 0.99) * 1e6,
+        "max_us": timings[-1] * 1e6,
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build(results, settings):
+    return {
+        "version": REPORT_VERSION,
+        "commit": commit(),
+        "created": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+
+
+def write(report, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def print_results(size, results):
+    print(f"\n{size} reaction-role rows")
+    print(
+        f"{'workload':<24}{'ops/s':>12}{'p50 (us)':>12}{'p99 (us)':>12}"
+        f"{'max (us)':>12}"
+    )
+    for name, stats in results.items():
+        print(
+            f"{name:<24}{stats['ops_per_s']:>12.0f}{stats['p50_us']:>12.1f}"
+            f"{stats['p99_us']:>12.1f}{stats['max_us']:>12.1f}"
+        )
+
+
+def print_comparison(old, new):
+    """p50 and p99 of ``new`` relative to ``old`` for every workload both
+    reports have, below 1.00 is faster."""
+    print(f"\n{old.get('commit') or 'old'} -> {new.get('commit') or 'new'}")
+    for size, results in new["results"].items():
+        previous = old["results"].get(size)
+        if previous is None:
+            continue
+
+        print(f"\n{size} reaction-role rows")
+        print(f"{'workload':<24}{'p50':>10}{'p99':>10}")
+        for name, stats in results.items():
+            before = previous.get(name)
+            if before is None or not before["p50_us"] or not before["p99_us"]:
+                continue
+            print(
+                f"{name:<24}{stats['p50_us'] / before['p50_us']:>10.2f}"
+                f"{stats['p99_us'] / before['p99_us']:>10.2f}"
+            )
@@ -0,0 +1,137 @@
+"""Synthetic reactionlight databases for the benchmark suite.
+
+A database of ``rows`` reaction-role rows gets ``rows // REACTIONS_PER_MESSAGE``
+messages spread over guilds of MESSAGES_PER_GUILD messages each, with a few
+channels, admin roles and settings per guild. Files are created through
+SchemaHandler so they have the same schema and indexes as a migrated bot.
+Files at an older ``version`` start from the tables of the original
+reactionlight.db and are migrated up to that version.
+"""
+import sqlite3
+from typing import NamedTuple
+
+from core.database import initialize
+from core.schema import LATEST_VERSION, SchemaHandler
+
+REACTIONS = ["🍎", "🍌", "🍒", "🍇", "🍉", "🍋", "🍑", "🍍", "🥝", "🥥"]
+REACTIONS_PER_MESSAGE = 10
+MESSAGES_PER_GUILD = 100
+CHANNELS_PER_GUILD = 5
+ADMINS_PER_GUILD = 3
+
+# Seeded message ids start here, workloads create new ones below it
+MESSAGE_BASE = 10**12
+
+# What initialize() created before SchemaHandler existed: random INT
+# reactionrole ids without keys, and none of the lookup indexes
+BASELINE_TABLES = [
+    "CREATE TABLE messages ('message_id' INT, 'channel' INT, 'reactionrole_id' INT,"
+    " 'guild_id' INT, 'limit_to_one' INT);",
+    "CREATE TABLE reactionroles ('reactionrole_id' INT, 'reaction' NVCARCHAR,"
+    " 'role_id' INT);",
+    "CREATE TABLE admins ('role_id' INT, 'guild_id' INT);",
+    "CREATE TABLE cleanup_queue_guilds ('guild_id' INT, 'unix_timestamp' INT);",
+    "CREATE TABLE dbinfo ('version' INT);",
+    "CREATE TABLE guild_settings ('guild_id' INT, 'notify' INT, 'systemchannel'"
+    " INT);",
+    "CREATE UNIQUE INDEX guild_id_idx ON guild_settings (guild_id);",
+    "CREATE UNIQUE INDEX reactionrole_idx ON messages (reactionrole_id);",
+    "CREATE UNIQUE INDEX guild_id_index ON cleanup_queue_guilds (guild_id);",
+]
+
+
+class Dataset(NamedTuple):
+    rows: int
+    messages: int
+    guilds: int
+
+    def message_id(self, i):
+        return MESSAGE_BASE + i % self.messages
+
+    def guild_id(self, i):
+        return 1 + i % self.guilds
+
+    def channel_id(self, i):
+        guild_id = self.guild_id(i)
+        return guild_id * 10 + i % CHANNELS_PER_GUILD
+
+
+class OfflineClient:
+    # Stands in for the bot during migrations, the seeded file has no rows
+    # the gateway steps would have to look up
+    guilds = ()
+
+
+def reaction(j):
+    return REACTIONS[j % len(REACTIONS)] + str(j // len(REACTIONS))
+
+
+def seed(
+    path, rows, reactions_per_message=REACTIONS_PER_MESSAGE, version=LATEST_VERSION
+):
+    messages = max(1, rows // reactions_per_message)
+    guilds = max(1, messages // MESSAGES_PER_GUILD)
+    dataset = Dataset(messages * reactions_per_message, messages, guilds)
+
+    if version < 5:
+        # initialize() already has the v5 tables, the older steps would
+        # have nothing left to do on them
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                for statement in BASELINE_TABLES:
+                    conn.execute(statement)
+        finally:
+            conn.close()
+    else:
+        initialize(path)
+    handler = SchemaHandler(path, OfflineClient())
+    try:
+        handler.migrate(until=version)
+    finally:
+        handler.close()
+
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages ('message_id', 'channel', 'reactionrole_id',"
+                " 'guild_id', 'limit_to_one') values(?, ?, ?, ?, ?);",
+                (
+                    (
+                        dataset.message_id(i),
+                        dataset.channel_id(i),
+                        i + 1,
+                        dataset.guild_id(i),
+                        i % 2,
+                    )
+                    for i in range(messages)
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO reactionroles ('reactionrole_id', 'reaction', 'role_id')"
+                " values(?, ?, ?);",
+                (
+                    (i + 1, reaction(j), j + 1)
+                    for i in range(messages)
+                    for j in range(reactions_per_message)
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO admins ('role_id', 'guild_id') values(?, ?);",
+                (
+                    (guild_id * 10 + k, guild_id)
+                    for guild_id in range(1, guilds + 1)
+                    for k in range(ADMINS_PER_GUILD)
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO guild_settings ('guild_id', 'notify', 'systemchannel')"
+                " values(?, ?, ?);",
+                ((guild_id, 1, guild_id * 10) for guild_id in range(1, guilds + 1, 2)),
+            )
+        conn.execute("ANALYZE;")
+    finally:
+        conn.close()
+
+    return dataset
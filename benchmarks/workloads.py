@@ -0,0 +1,234 @@
+"""What the suite measures, one Workload per public Database method plus a
+few mixed ones.
+
+``call(i)`` is timed, ``setup(i)`` and ``teardown(i)`` run around it
+untimed so destructive methods always find something to act on.
+"""
+import itertools
+import random
+from typing import Callable, NamedTuple, Optional
+
+from .seed import MESSAGE_BASE
+
+# Ids the write workloads create, kept clear of the seeded ones
+NEW_MESSAGE_BASE = MESSAGE_BASE // 2
+NEW_GUILD_BASE = 10**9
+NEW_ROLE_BASE = 10**9
+
+# Public methods that are not benchmarked on their own
+EXCLUDED = {
+    "close": "tears the pool down",
+    "write": "every mutation goes through it",
+    "restore": "replaces the whole database",
+    "enable_incremental_vacuum": "one-off VACUUM of the whole file",
+}
+
+
+class Workload(NamedTuple):
+    name: str
+    call: Callable[[int], object]
+    setup: Optional[Callable[[int], object]] = None
+    teardown: Optional[Callable[[int], object]] = None
+    # Caps the iterations of calls that walk whole tables
+    iterations: Optional[int] = None
+
+
+def reaction_role(message_id, guild_id, channel_id=1):
+    return {
+        "message": {
+            "message_id": message_id,
+            "channel_id": channel_id,
+            "guild_id": guild_id,
+        },
+        "limit_to_one": 0,
+        "reactions": {"👍": 1, "👎": 2},
+    }
+
+
+def method_workloads(db, dataset):
+    pick = random.Random(0)
+
+    def message_id(_):
+        return dataset.message_id(pick.randrange(dataset.messages))
+
+    def guild_id(_):
+        return dataset.guild_id(pick.randrange(dataset.guilds))
+
+    def channel_id(_):
+        return dataset.channel_id(pick.randrange(dataset.messages))
+
+    # Every workload that creates rows gets an id range of its own
+    blocks = itertools.count(1)
+
+    def id_range(base):
+        start = base + next(blocks) * 10**6
+        return lambda i: start + i
+
+    added = id_range(NEW_MESSAGE_BASE)
+    deleted = id_range(NEW_MESSAGE_BASE)
+    guild_messages = id_range(NEW_MESSAGE_BASE)
+    removed_guild = id_range(NEW_GUILD_BASE)
+    removed_guilds = id_range(NEW_GUILD_BASE)
+    cleanup_guild = id_range(NEW_GUILD_BASE)
+    admin_guild = guild_id(0)
+
+    def add_guild_message(guild_id):
+        return db.add_reaction_role(reaction_role(guild_messages(guild_id), guild_id))
+
+    return [
+        # Reads
+        Workload("manages", lambda i: db.manages(message_id(i))),
+        Workload("exists", lambda i: db.exists(message_id(i))),
+        Workload("get_reactions", lambda i: db.get_reactions(message_id(i))),
+        Workload("isunique", lambda i: db.isunique(message_id(i))),
+        Workload(
+            "get_reaction_config", lambda i: db.get_reaction_config(message_id(i))
+        ),
+        Workload("fetch_messages", lambda i: db.fetch_messages(channel_id(i))),
+        Workload("get_admins", lambda i: db.get_admins(guild_id(i))),
+        Workload("admin_roles", lambda i: db.admin_roles(guild_id(i))),
+        Workload("get_guild_settings", lambda i: db.get_guild_settings(guild_id(i))),
+        Workload("fetch_systemchannel", lambda i: db.fetch_systemchannel(guild_id(i))),
+        Workload("notify", lambda i: db.notify(guild_id(i))),
+        Workload("get_selection", lambda i: db.get_selection(message_id(i), i)),
+        Workload("fetch_cleanup_guilds", lambda i: db.fetch_cleanup_guilds()),
+        Workload("fetch_all_messages", lambda i: db.fetch_all_messages(), iterations=5),
+        Workload("fetch_all_guilds", lambda i: db.fetch_all_guilds(), iterations=5),
+        Workload(
+            "iter_messages",
+            lambda i: sum(len(chunk) for chunk in db.iter_messages()),
+            iterations=5,
+        ),
+        Workload(
+            "iter_guilds",
+            lambda i: sum(len(chunk) for chunk in db.iter_guilds()),
+            iterations=5,
+        ),
+        # Writes
+        Workload(
+            "add_reaction_role",
+            lambda i: db.add_reaction_role(reaction_role(added(i), admin_guild)),
+        ),
+        Workload(
+            "delete",
+            lambda i: db.delete(deleted(i)),
+            setup=lambda i: db.add_reaction_role(reaction_role(deleted(i), admin_guild)),
+        ),
+        Workload(
+            "add_reaction",
+            lambda i: db.add_reaction(dataset.message_id(i), 1, f"bench{i}"),
+        ),
+        Workload(
+            "remove_reaction",
+            lambda i: db.remove_reaction(dataset.message_id(i), f"bench{i}"),
+            setup=lambda i: db.add_reaction(dataset.message_id(i), 1, f"bench{i}"),
+        ),
+        Workload("add_admin", lambda i: db.add_admin(NEW_ROLE_BASE + i, admin_guild)),
+        Workload(
+            "remove_admin",
+            lambda i: db.remove_admin(NEW_ROLE_BASE + i, admin_guild),
+            setup=lambda i: db.add_admin(NEW_ROLE_BASE + i, admin_guild),
+        ),
+        Workload(
+            "add_systemchannel",
+            lambda i: db.add_systemchannel(dataset.guild_id(i), channel_id(i)),
+        ),
+        Workload(
+            "remove_systemchannel",
+            lambda i: db.remove_systemchannel(dataset.guild_id(i)),
+        ),
+        Workload("toggle_notify", lambda i: db.toggle_notify(guild_id(i))),
+        Workload(
+            "set_selection",
+            lambda i: db.set_selection(message_id(i), i, f"bench{i % 2}"),
+        ),
+        Workload(
+            "clear_selection",
+            lambda i: db.clear_selection(dataset.message_id(i), i, "bench"),
+            setup=lambda i: db.set_selection(dataset.message_id(i), i, "bench"),
+        ),
+        Workload(
+            "add_guild",
+            lambda i: db.add_guild(dataset.channel_id(i), dataset.guild_id(i)),
+        ),
+        Workload(
+            "add_cleanup_guild",
+            lambda i: db.add_cleanup_guild(cleanup_guild(i), i),
+        ),
+        Workload(
+            "remove_cleanup_guild",
+            lambda i: db.remove_cleanup_guild(cleanup_guild(i)),
+            setup=lambda i: db.add_cleanup_guild(cleanup_guild(i), i),
+        ),
+        Workload(
+            "remove_guild",
+            lambda i: db.remove_guild(removed_guild(i)),
+            setup=lambda i: add_guild_message(removed_guild(i)),
+        ),
+        Workload(
+            "remove_guilds",
+            lambda i: db.remove_guilds([removed_guilds(2 * i), removed_guilds(2 * i + 1)]),
+            setup=lambda i: [add_guild_message(removed_guilds(2 * i + k)) for k in range(2)],
+        ),
+        Workload(
+            "archive_guilds",
+            lambda i: db.archive_guilds([dataset.guild_id(i)]),
+            teardown=lambda i: db.restore_guild(dataset.guild_id(i)),
+        ),
+        Workload(
+            "restore_guild",
+            lambda i: db.restore_guild(dataset.guild_id(i)),
+            setup=lambda i: db.archive_guilds([dataset.guild_id(i)]),
+        ),
+        Workload(
+            "write_batch",
+            lambda i: db.write_batch(
+                [(db._toggle_notify, (dataset.guild_id(i + k),)) for k in range(64)]
+            ),
+        ),
+        # Upkeep
+        Workload("checkpoint", lambda i: db.checkpoint()),
+        Workload("file_stats", lambda i: db.file_stats()),
+        Workload("incremental_vacuum", lambda i: db.incremental_vacuum(64)),
+        Workload("optimize", lambda i: db.optimize(), iterations=5),
+        Workload("quick_check", lambda i: db.quick_check(), iterations=3),
+        Workload("reload_index", lambda i: db.reload_index(), iterations=3),
+        Workload("check_index", lambda i: db.check_index(), iterations=3),
+    ]
+
+
+def mixed_workloads(db, dataset):
+    """Random interleavings of the reaction listeners' reads with writes,
+    at a read-heavy and at an even ratio."""
+    def message_id(r):
+        return dataset.message_id(r.randrange(dataset.messages))
+
+    def guild_id(r):
+        return dataset.guild_id(r.randrange(dataset.guilds))
+
+    reads = [
+        lambda i, r: db.get_reaction_config(message_id(r)),
+        lambda i, r: db.exists(message_id(r)),
+        lambda i, r: db.notify(guild_id(r)),
+        lambda i, r: db.admin_roles(guild_id(r)),
+        lambda i, r: db.fetch_messages(dataset.channel_id(r.randrange(dataset.messages))),
+    ]
+    writes = [
+        lambda i, r: db.add_reaction(dataset.message_id(i), 1, f"mixed{i}"),
+        lambda i, r: db.remove_reaction(dataset.message_id(i - 1), f"mixed{i - 1}"),
+        lambda i, r: db.toggle_notify(guild_id(r)),
+    ]
+
+    def mixed(read_share):
+        pick = random.Random(1)
+
+        def call(i):
+            ops = reads if pick.random() < read_share else writes
+            return pick.choice(ops)(i, pick)
+
+        return call
+
+    return [
+        Workload("mixed_95_read", mixed(0.95)),
+        Workload("mixed_50_read", mixed(0.5)),
+    ]
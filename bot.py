@@ -1,5 +1,7 @@
 import ast
+import asyncio
 import datetime
+import functools
 import logging
 import os
 import time
@@ -10,7 +12,7 @@ import discord
 import dotenv
 from discord.ext import commands
 
-from core import database, schema
+from core import AsyncDatabase, InstanceLock, schema
 from lib import PaginatedHelpCommand
 
 log = logging.getLogger(__name__)
@@ -33,21 +35,32 @@ def format_dt(dt, style=None):
     return f"<t:{int(dt.timestamp())}:{style}>"
 
 
-async def database_updates(bot):
+async def database_updates(bot, gateway=True):
+    # Applies pending schema migrations, returns True once none are left.
+    # Only the guild cache is read on the loop, the steps run in a thread so
+    # a long rebuild does not hold up the heartbeat.
+    loop = asyncio.get_running_loop()
     handler = schema.SchemaHandler(bot.db_file, bot)
-    if handler.version == 0:
-        handler.zero_to_one()
-        messages = bot.db.fetch_all_messages()
-        for message in messages:
-            channel_id = message[1]
-            channel = bot.get_channel(channel_id)
-            bot.db.add_guild(channel.id, channel.guild.id)
-
-    if handler.version == 1:
-        handler.one_to_two()
-
-    if handler.version == 2:
-        handler.two_to_three()
+    try:
+        if gateway:
+            handler.load_gateway()
+        migrated = await loop.run_in_executor(
+            None, functools.partial(handler.migrate, gateway=gateway)
+        )
+    finally:
+        handler.close()
+
+    for step, elapsed in handler.timings.items():
+        log.info("Database migration %s took %.3fs", step, elapsed)
+    if handler.unresolved_channels:
+        log.warning(
+            "Could not find the guild of %d channels with reaction-role messages: %s",
+            len(handler.unresolved_channels),
+            ", ".join(map(str, handler.unresolved_channels)),
+        )
+    if handler.timings:
+        await bot.db.run_write(bot.db.sync.reload_index)
+    return migrated
 
 
 def get_prefix(bot, message):
@@ -60,7 +73,13 @@ class AnbuBot(commands.AutoShardedBot):
     def __init__(self):
         directory = os.path.dirname(os.path.realpath(__file__))
         self.db_file = f"{directory}/reactionlight.db"
-        self.db = database.Database(self.db_file)
+        # Rows of guilds the bot has left, restored if they add it back
+        self.archive_file = f"{directory}/archive.db"
+        # Keeps python -m core from writing behind the caches while running
+        self.instance_lock = InstanceLock(self.db_file)
+        # Opened in start() once the lock is held
+        self.db = None
+        self.migrated = False
         allowed_mentions = discord.AllowedMentions(
             roles=True, everyone=True, users=True
         )
@@ -112,8 +131,28 @@ class AnbuBot(commands.AutoShardedBot):
         except Exception as e:
             log.critical("An exception occured, %s", e)
 
+    async def start(self, *args, **kwargs):
+        if not self.instance_lock.acquire():
+            raise RuntimeError(
+                f"{self.db_file} is in use by another process"
+                f" (pid {self.instance_lock.owner}), stop it first"
+            )
+        self.db = AsyncDatabase(self.db_file, archive=self.archive_file)
+        # Migrations run before the gateway connects, only the steps that
+        # need the guild cache are left for on_ready
+        self.migrated = await database_updates(self, gateway=False)
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        await super().close()
+        if self.db is not None:
+            await self.db.flush()
+            self.db.close()
+        self.instance_lock.release()
+
     async def on_ready(self):
-        await database_updates(self)
+        if not self.migrated:
+            self.migrated = await database_updates(self)
         cog_dir = Path(__file__).resolve(strict=True).parent / join("cogs")
         for filename in os.listdir(cog_dir):
             if os.path.isdir(cog_dir / filename) and filename != "util":
@@ -0,0 +1,113 @@
+import asyncio
+import functools
+import os
+import time
+
+import discord
+from discord.ext import commands, tasks
+
+from core import backup
+
+
+class BackupPlugin(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.description = "Snapshots of the reaction-role database"
+        self.directory = os.path.join(os.path.dirname(self.bot.db_file), "backups")
+        self.auto_backup.start()
+
+    def cog_unload(self):
+        self.auto_backup.cancel()
+
+    @property
+    def display_emoji(self) -> discord.PartialEmoji:
+        return discord.PartialEmoji(name="\N{FLOPPY DISK}")
+
+    async def take_snapshot(self):
+        # The copy sleeps between page batches on an executor thread, the
+        # bot keeps reading and writing the database meanwhile
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        path = await loop.run_in_executor(
+            None,
+            functools.partial(
+                backup.snapshot,
+                self.bot.db_file,
+                self.directory,
+                archive=self.bot.archive_file,
+            ),
+        )
+        return path, time.perf_counter() - start
+
+    @tasks.loop(hours=24)
+    async def auto_backup(self):
+        try:
+            path, elapsed = await self.take_snapshot()
+        except (backup.BackupError, OSError) as e:
+            print(f"Automatic database backup failed: {e}")
+            return
+
+        print(f"Backed up the database to {path} in {elapsed:.2f}s")
+
+    @auto_backup.before_loop
+    async def before_auto_backup(self):
+        await self.bot.wait_until_ready()
+
+    @commands.is_owner()
+    @commands.group(name="backup", invoke_without_command=True)
+    async def backup_group(self, ctx):
+        """Take a snapshot of the database now"""
+        try:
+            path, elapsed = await self.take_snapshot()
+        except (backup.BackupError, OSError) as e:
+            await ctx.send(f"Backup failed:\n```\n{e}\n```")
+            return
+
+        await ctx.send(
+            f"Saved `{os.path.basename(path)}` ({os.path.getsize(path)} bytes)"
+            f" in {elapsed:.2f}s"
+        )
+
+    @commands.is_owner()
+    @backup_group.command(name="list")
+    async def backup_list(self, ctx):
+        """List the stored snapshots"""
+        paths = backup.snapshots(self.directory)
+        if not paths:
+            await ctx.send("There are no snapshots yet.")
+            return
+
+        lines = [
+            f"`{os.path.basename(path)}` {os.path.getsize(path)} bytes"
+            for path in reversed(paths)
+        ]
+        await ctx.send("\n".join(lines))
+
+    @commands.is_owner()
+    @backup_group.command(name="restore")
+    async def backup_restore(self, ctx, name: str):
+        """Replace the database with one of the stored snapshots"""
+        path = os.path.join(self.directory, os.path.basename(name))
+        if path not in backup.snapshots(self.directory):
+            await ctx.send(f"There is no snapshot called `{name}`.")
+            return
+
+        # Everything queued has to land before the file is replaced
+        await self.bot.db.flush()
+        try:
+            result = await self.bot.db.run(
+                backup.restore_online, self.bot.db.sync, path
+            )
+        except backup.BackupError as e:
+            await ctx.send(f"Cannot restore `{name}`:\n```\n{e}\n```")
+            return
+
+        if isinstance(result, Exception):
+            await ctx.send(f"Database error while restoring:\n```\n{result}\n```")
+            return
+
+        await ctx.send(f"Restored the database from `{name}`.")
+
+
+def setup(bot):
+    bot.add_cog(BackupPlugin(bot))
@@ -1,25 +1,20 @@
 import asyncio
 import datetime
+import time
 from pathlib import Path
 
 import discord
 from discord.ext import commands, tasks
 
+from lib.classes.locks import KeyedLock
+from lib.classes.roles import RoleCoalescer
+from lib.classes.scheduler import RoleScheduler
 
-class Locks:
-    def __init__(self):
-        self.locks = {}
-        self.main_lock = asyncio.Lock()
-
-    async def get_lock(self, user_id):
-        async with self.main_lock:
-            if not user_id in self.locks:
-                self.locks[user_id] = asyncio.Lock()
-
-            return self.locks[user_id]
-
-
-lock_manager = Locks()
+# Free pages returned per incremental_vacuum slice, at most MAX_VACUUM_SLICES
+# slices a run with a pause in between so queued writes get through
+VACUUM_SLICE = 256
+MAX_VACUUM_SLICES = 64
+VACUUM_PAUSE = 0.1
 
 
 class ReactionRolesEvents(commands.Cog):
@@ -27,6 +22,12 @@ class ReactionRolesEvents(commands.Cog):
         self.bot = bot
         self.db = bot.db
         self.base_dir = Path(__file__).resolve().parent
+        # Serialises the reaction events of each member
+        self.locks = KeyedLock()
+        # Admits the reaction events of each guild and merges a member's role
+        # changes into one edit, which then waits its guild's turn
+        self.role_scheduler = RoleScheduler()
+        self.role_edits = RoleCoalescer(scheduler=self.role_scheduler)
 
     async def getchannel(self, channel_id):
         channel = self.bot.get_channel(channel_id)
@@ -49,14 +50,15 @@ class ReactionRolesEvents(commands.Cog):
         print("Reaction Light ready!")
         self.cleandb.start()
         self.check_cleanup_queued_guilds.start()
+        self.maintenance.start()
 
     @tasks.loop(hours=6)
     async def check_cleanup_queued_guilds(self):
-        cleanup_guild_ids = self.db.fetch_cleanup_guilds(guild_ids_only=True)
+        cleanup_guild_ids = await self.db.fetch_cleanup_guilds(guild_ids_only=True)
         for guild_id in cleanup_guild_ids:
             try:
                 await self.bot.fetch_guild(guild_id)
-                self.db.remove_cleanup_guild(guild_id)
+                await self.db.remove_cleanup_guild(guild_id)
 
             except discord.Forbidden:
                 continue
@@ -66,7 +68,7 @@ class ReactionRolesEvents(commands.Cog):
         system_channel1 = await self.getguild(guild_id)
         system_channel = system_channel1.system_channel
         if guild_id:
-            server_channel = self.db.fetch_systemchannel(guild_id)
+            server_channel = await self.db.fetch_systemchannel(guild_id)
 
             if isinstance(server_channel, Exception):
                 await self.system_notification(
@@ -76,9 +78,6 @@ class ReactionRolesEvents(commands.Cog):
                 )
                 return
 
-            if server_channel:
-                server_channel = server_channel[0][0]
-
             if server_channel:
                 try:
                     target_channel = await self.getchannel(server_channel)
@@ -113,22 +112,8 @@ class ReactionRolesEvents(commands.Cog):
         else:
             print(text)
 
-    @tasks.loop(hours=24)
-    async def cleandb(self):
-        # Cleans the database by deleting rows of reaction role messages that don't exist anymore
-        messages = self.db.fetch_all_messages()
-        guilds = self.db.fetch_all_guilds()
-        # Get the cleanup queued guilds
-        cleanup_guild_ids = self.db.fetch_cleanup_guilds(guild_ids_only=True)
-
-        if isinstance(messages, Exception):
-            await self.system_notification(
-                None,
-                "Database error when fetching messages during database"
-                f" cleaning:\n```\n{messages}\n```",
-            )
-            return
-
+    async def clean_messages(self, messages):
+        # Returns False when cleandb should stop
         for message in messages:
             try:
                 channel_id = message[1]
@@ -139,7 +124,7 @@ class ReactionRolesEvents(commands.Cog):
             except discord.NotFound as e:
                 # If unknown channel or unknown message
                 if e.code in (10003, 10008):
-                    delete = self.db.delete(message[0], message[3])
+                    delete = await self.db.delete(message[0])
 
                     if isinstance(delete, Exception):
                         await self.system_notification(
@@ -147,7 +132,7 @@ class ReactionRolesEvents(commands.Cog):
                             "Database error when deleting messages during database"
                             f" cleaning:\n```\n{delete}\n```",
                         )
-                        return
+                        return False
 
                     await self.system_notification(
                         channel.guild.id,
@@ -164,30 +149,65 @@ class ReactionRolesEvents(commands.Cog):
                     f"\n\nID: {message[0]} in channel {message[1]}",
                 )
 
-        if isinstance(guilds, Exception):
-            await self.system_notification(
-                None,
-                "Database error when fetching guilds during database"
-                f" cleaning:\n```\n{guilds}\n```",
-            )
-            return
+        return True
 
-        for guild_id in guilds:
+    async def check_guilds(self, guild_ids, cleanup_guild_ids):
+        for guild_id in guild_ids:
             try:
                 await self.bot.fetch_guild(guild_id)
                 if guild_id in cleanup_guild_ids:
-                    self.db.remove_cleanup_guild(guild_id)
+                    await self.db.remove_cleanup_guild(guild_id)
 
             except discord.Forbidden:
                 # If unknown guild
                 if guild_id in cleanup_guild_ids:
                     continue
                 else:
-                    self.db.add_cleanup_guild(
+                    await self.db.add_cleanup_guild(
                         guild_id, round(datetime.datetime.utcnow().timestamp())
                     )
 
-        cleanup_guilds = self.db.fetch_cleanup_guilds()
+    @tasks.loop(hours=24)
+    async def cleandb(self):
+        # Cleans the database by deleting rows of reaction role messages that don't exist anymore
+        # Get the cleanup queued guilds
+        cleanup_guild_ids = await self.db.fetch_cleanup_guilds(guild_ids_only=True)
+
+        # Messages and guilds are streamed in pages so memory stays flat
+        # however many reaction-role messages there are
+        async for messages in self.db.iter_messages():
+            if isinstance(messages, Exception):
+                await self.system_notification(
+                    None,
+                    "Database error when fetching messages during database"
+                    f" cleaning:\n```\n{messages}\n```",
+                )
+                return
+
+            if not await self.clean_messages(messages):
+                return
+
+        if isinstance(cleanup_guild_ids, Exception):
+            await self.system_notification(
+                None,
+                "Database error when fetching cleanup guilds during"
+                f" cleaning:\n```\n{cleanup_guild_ids}\n```",
+            )
+            return
+
+        cleanup_guild_ids = set(cleanup_guild_ids)
+        async for guilds in self.db.iter_guilds():
+            if isinstance(guilds, Exception):
+                await self.system_notification(
+                    None,
+                    "Database error when fetching guilds during database"
+                    f" cleaning:\n```\n{guilds}\n```",
+                )
+                return
+
+            await self.check_guilds(guilds, cleanup_guild_ids)
+
+        cleanup_guilds = await self.db.fetch_cleanup_guilds()
 
         if isinstance(cleanup_guilds, Exception):
             await self.system_notification(
@@ -198,141 +218,305 @@ class ReactionRolesEvents(commands.Cog):
             return
 
         current_timestamp = round(datetime.datetime.utcnow().timestamp())
+        purge_guild_ids = []
         for guild in cleanup_guilds:
             if int(guild[1]) - current_timestamp <= -86400:
                 # The guild has been invalid / unreachable for more than 24 hrs, try one more fetch then give up and purge the guilds database entries
                 try:
                     await self.bot.fetch_guild(guild[0])
-                    self.db.remove_cleanup_guild(guild[0])
+                    await self.db.remove_cleanup_guild(guild[0])
                     continue
 
                 except discord.Forbidden:
-                    delete = self.db.remove_guild(guild[0])
-                    delete2 = self.db.remove_cleanup_guild(guild[0])
-                    if isinstance(delete, Exception):
-                        await self.system_notification(
-                            None,
-                            "Database error when deleting a guilds datebase entries during"
-                            f" database cleaning:\n```\n{delete}\n```",
-                        )
-                        return
+                    purge_guild_ids.append(guild[0])
 
-                    elif isinstance(delete2, Exception):
-                        await self.system_notification(
-                            None,
-                            "Database error when deleting a guilds datebase entries during"
-                            f" database cleaning:\n```\n{delete2}\n```",
-                        )
-                        return
+        if purge_guild_ids:
+            # One transaction for every guild, this also clears their cleanup_queue_guilds rows
+            archived = await self.db.archive_guilds(purge_guild_ids)
+            if isinstance(archived, Exception):
+                await self.system_notification(
+                    None,
+                    "Database error when archiving a guilds datebase entries during"
+                    f" database cleaning:\n```\n{archived}\n```",
+                )
+                return
+
+            print(
+                f"Archived {len(purge_guild_ids)} guilds: "
+                + ", ".join(f"{table}={count}" for table, count in archived.items())
+            )
+
+    @tasks.loop(hours=24)
+    async def maintenance(self):
+        # Every step runs on the database maintenance thread, the vacuum in
+        # short write transactions so it never holds the writer for long
+        start = time.perf_counter()
+        before = await self.db.maintain(self.db.sync.file_stats)
+        if isinstance(before, Exception):
+            await self.system_notification(
+                None,
+                f"Database error during maintenance:\n```\n{before}\n```",
+            )
+            return
+
+        error = await self.db.maintain(self.db.sync.optimize)
+        if isinstance(error, Exception):
+            await self.system_notification(
+                None,
+                f"Database error when optimizing:\n```\n{error}\n```",
+            )
+            return
+
+        # Databases created before incremental vacuum was enabled need a full
+        # VACUUM, which would hold the writer for the whole rewrite. That is
+        # left to ``python -m core vacuum`` with the bot stopped.
+        slices = MAX_VACUUM_SLICES if before.auto_vacuum == 2 else 0
+        if not slices:
+            print(
+                "Database maintenance skipped incremental_vacuum, run"
+                " `python -m core vacuum` once to enable it"
+            )
+        for _ in range(slices):
+            remaining = await self.db.maintain(
+                self.db.sync.incremental_vacuum, VACUUM_SLICE
+            )
+            if isinstance(remaining, Exception):
+                await self.system_notification(
+                    None,
+                    f"Database error when vacuuming:\n```\n{remaining}\n```",
+                )
+                return
+            if not remaining:
+                break
+            await asyncio.sleep(VACUUM_PAUSE)
+
+        # The file only shrinks once the vacuumed pages are checkpointed
+        await self.db.checkpoint()
+
+        check = await self.db.maintain(self.db.sync.quick_check)
+        if isinstance(check, Exception) or check != ["ok"]:
+            errors = check if isinstance(check, Exception) else "\n".join(check)
+            await self.system_notification(
+                None,
+                f"The database failed its integrity check:\n```\n{errors}\n```",
+            )
+
+        after = await self.db.maintain(self.db.sync.file_stats)
+        if isinstance(after, Exception):
+            return
+
+        print(
+            f"Database maintenance took {time.perf_counter() - start:.2f}s:"
+            f" {before.size} -> {after.size} bytes (WAL {after.wal_size} bytes),"
+            f" {before.freelist_count} -> {after.freelist_count} free pages"
+        )
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
-        self.db.remove_guild(guild.id)
+        await self.db.archive_guilds((guild.id,))
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        restored = await self.db.restore_guild(guild.id)
+        if isinstance(restored, Exception):
+            await self.system_notification(
+                None,
+                f"Database error when restoring the archived entries of {guild.id}:"
+                f"\n```\n{restored}\n```",
+            )
+            return
+
+        if any(restored.values()):
+            print(
+                f"Restored the archived entries of {guild.id}: "
+                + ", ".join(f"{table}={count}" for table, count in restored.items())
+            )
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
+        if not self.db.manages(payload.message_id):
+            # Most reactions are on messages the bot does not manage
+            return
+
+        # A burst in one guild waits here, before it takes locks or queues
+        # role changes
+        async with self.role_scheduler.admit(payload.guild_id):
+            await self.reaction_added(payload)
+
+    async def reaction_added(self, payload):
         reaction = str(payload.emoji)
         msg_id = payload.message_id
         ch_id = payload.channel_id
         user_id = payload.user_id
         guild_id = payload.guild_id
-        exists = self.db.exists(msg_id)
+        config = await self.db.get_reaction_config(msg_id)
+        member = payload.member
+        changes = []
 
-        async with await lock_manager.get_lock(user_id):
-            if isinstance(exists, Exception):
+        async with self.locks.hold(guild_id, user_id):
+            if isinstance(config, Exception):
                 await self.system_notification(
                     guild_id,
-                    f"Database error after a user added a reaction:\n```\n{exists}\n```",
+                    f"Database error after a user added a reaction:\n```\n{config}\n```",
                 )
 
-            elif exists:
+            elif config.exists:
                 # Checks that the message that was reacted to is a reaction-role message managed by the bot
-                reactions = self.db.get_reactions(msg_id)
-
-                if isinstance(reactions, Exception):
-                    await self.system_notification(
-                        guild_id,
-                        f"Database error when getting reactions:\n```\n{reactions}\n```",
-                    )
-                    return
-
+                reactions = config.reactions
                 ch = self.bot.get_channel(ch_id)
-                msg = await ch.fetch_message(msg_id)
-                user = self.bot.get_user(user_id)
                 if reaction not in reactions:
                     # Removes reactions added to the reaction-role message that are not connected to any role
-                    await msg.remove_reaction(reaction, user)
-
-                else:
-                    # Gives role if it has permissions, else 403 error is raised
-                    role_id = reactions[reaction]
-                    server = await self.getguild(guild_id)
-                    member = server.get_member(user_id)
-                    role = discord.utils.get(server.roles, id=role_id)
-                    if user_id != self.bot.user.id:
-                        unique = self.db.isunique(msg_id)
-                        if unique:
-                            for existing_reaction in msg.reactions:
-                                if str(existing_reaction.emoji) == reaction:
-                                    continue
-                                async for reaction_user in existing_reaction.users():
-                                    if reaction_user.id == user_id:
-                                        await msg.remove_reaction(
-                                            existing_reaction, user
-                                        )
-                                        # We can safely break since a user can only have one reaction at once
-                                        break
-
-                        try:
-                            await member.add_roles(role)
-                            notify = self.db.notify(guild_id)
-                            if isinstance(notify, Exception):
-                                await self.system_notification(
-                                    guild_id,
-                                    f"Database error when checking if role notifications are turned on:\n```\n{notify}\n```",
-                                )
-                                return
-
-                            if notify:
-                                await user.send(
-                                    f"You now have the following role: **{role.name}**"
-                                )
+                    await ch.get_partial_message(msg_id).remove_reaction(
+                        payload.emoji, member
+                    )
 
-                        except discord.Forbidden:
+                elif user_id != self.bot.user.id:
+                    role = member.guild.get_role(reactions[reaction])
+                    if config.limit_to_one:
+                        previous = await self.db.set_selection(
+                            msg_id, user_id, reaction
+                        )
+                        if isinstance(previous, Exception):
                             await self.system_notification(
                                 guild_id,
-                                "Someone tried to add a role to themselves but I do not have"
-                                " permissions to add it. Ensure that I have a role that is"
-                                " hierarchically higher than the role I have to assign, and"
-                                " that I have the `Manage Roles` permission.",
+                                f"Database error when updating a limit to one selection:\n```\n{previous}\n```",
+                            )
+                            return
+
+                        if previous is not None:
+                            stale = [previous] if previous != reaction else []
+                        elif not self.db.selections_recorded(msg_id):
+                            stale = await self.unrecorded_selections(
+                                ch, msg_id, member, reactions, reaction
                             )
+                        else:
+                            stale = []
+
+                        for previous in stale:
+                            # The previous selection's role goes in the same edit,
+                            # the remove event of its reaction is then stale
+                            old_role = member.guild.get_role(reactions.get(previous))
+                            if old_role is not None:
+                                changes.append(self.role_edits.remove(member, old_role))
+                            try:
+                                await ch.get_partial_message(msg_id).remove_reaction(
+                                    previous, member
+                                )
+                            except discord.HTTPException:
+                                # The new role is still given, a leftover
+                                # reaction only costs a stale remove event
+                                pass
+
+                    # Gives role if it has permissions, else 403 error is raised
+                    changes.append(self.role_edits.add(member, role))
+
+        if not changes:
+            return
+
+        # Awaited outside the lock so the member's next reactions can still
+        # join the same edit
+        try:
+            added = (await asyncio.gather(*changes))[-1]
+            if not added:
+                return
+
+            notify = await self.db.notify(guild_id)
+            if isinstance(notify, Exception):
+                await self.system_notification(
+                    guild_id,
+                    f"Database error when checking if role notifications are turned on:\n```\n{notify}\n```",
+                )
+                return
+
+            if notify:
+                await member.send(f"You now have the following role: **{role.name}**")
+
+        except discord.Forbidden:
+            await self.system_notification(
+                guild_id,
+                "Someone tried to add a role to themselves but I do not have"
+                " permissions to add it. Ensure that I have a role that is"
+                " hierarchically higher than the role I have to assign, and"
+                " that I have the `Manage Roles` permission.",
+            )
+
+    async def unrecorded_selections(self, channel, msg_id, member, reactions, reaction):
+        # Selections made before schema v6 were never stored. They are the
+        # other reactions of the member on the message whose role they hold.
+        held = set(member._roles)
+        candidates = {
+            emoji
+            for emoji, role_id in reactions.items()
+            if role_id in held and role_id != reactions[reaction]
+        }
+        if not candidates:
+            return []
+
+        stale = []
+        try:
+            message = await channel.fetch_message(msg_id)
+            for message_reaction in message.reactions:
+                if str(message_reaction.emoji) not in candidates:
+                    continue
+                # Users come sorted by id, one page tells if the member is there
+                users = message_reaction.users(
+                    limit=1, after=discord.Object(id=member.id - 1)
+                )
+                async for user in users:
+                    if user.id == member.id:
+                        stale.append(str(message_reaction.emoji))
+        except discord.HTTPException:
+            # Better to leave an old role than to take one they were given
+            # some other way
+            return []
+        return stale
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload):
+        if not self.db.manages(payload.message_id):
+            # Most reactions are on messages the bot does not manage
+            return
+
+        async with self.role_scheduler.admit(payload.guild_id):
+            await self.reaction_removed(payload)
+
+    async def reaction_removed(self, payload):
         reaction = str(payload.emoji)
         msg_id = payload.message_id
         user_id = payload.user_id
         guild_id = payload.guild_id
-        exists = self.db.exists(msg_id)
+        config = await self.db.get_reaction_config(msg_id)
+        removed = None
 
-        if isinstance(exists, Exception):
-            await self.system_notification(
-                guild_id,
-                f"Database error after a user removed a reaction:\n```\n{exists}\n```",
-            )
-
-        elif exists:
-            # Checks that the message that was unreacted to is a reaction-role message managed by the bot
-            reactions = self.db.get_reactions(msg_id)
-
-            if isinstance(reactions, Exception):
+        async with self.locks.hold(guild_id, user_id):
+            if isinstance(config, Exception):
                 await self.system_notification(
                     guild_id,
-                    f"Database error when getting reactions:\n```\n{reactions}\n```",
+                    f"Database error after a user removed a reaction:\n```\n{config}\n```",
                 )
 
-            elif reaction in reactions:
-                role_id = reactions[reaction]
+            elif config.exists and reaction in config.reactions:
+                # Checks that the message that was unreacted to is a reaction-role message managed by the bot
+                if config.limit_to_one:
+                    # Usually answered from memory, so the removals the bot makes
+                    # for a swap skip the write queue
+                    selected = await self.db.get_selection(msg_id, user_id)
+                    if isinstance(selected, Exception) or selected in (None, reaction):
+                        selected = await self.db.clear_selection(
+                            msg_id, user_id, reaction
+                        )
+                        if isinstance(selected, Exception):
+                            await self.system_notification(
+                                guild_id,
+                                f"Database error when clearing a limit to one selection:\n```\n{selected}\n```",
+                            )
+                            return
+
+                    if selected is not None and selected != reaction:
+                        # Removed when the user swapped to another reaction, the
+                        # swap already took the role
+                        return
+
                 # Removes role if it has permissions, else 403 error is raised
                 server = await self.getguild(guild_id)
                 member = server.get_member(user_id)
@@ -340,30 +524,37 @@ class ReactionRolesEvents(commands.Cog):
                 if not member:
                     member = await server.fetch_member(user_id)
 
-                role = discord.utils.get(server.roles, id=role_id)
-                try:
-                    await member.remove_roles(role)
-                    notify = self.db.notify(guild_id)
-                    if isinstance(notify, Exception):
-                        await self.system_notification(
-                            guild_id,
-                            f"Database error when checking if role notifications are turned on:\n```\n{notify}\n```",
-                        )
-                        return
+                role = server.get_role(config.reactions[reaction])
+                removed = self.role_edits.remove(member, role)
 
-                    if notify:
-                        await member.send(
-                            f"You do not have the following role anymore: **{role.name}**"
-                        )
+        if removed is None:
+            return
 
-                except discord.Forbidden:
-                    await self.system_notification(
-                        guild_id,
-                        "Someone tried to remove a role from themselves but I do not have"
-                        " permissions to remove it. Ensure that I have a role that is"
-                        " hierarchically higher than the role I have to remove, and that I"
-                        " have the `Manage Roles` permission.",
-                    )
+        try:
+            if not await removed:
+                return
+
+            notify = await self.db.notify(guild_id)
+            if isinstance(notify, Exception):
+                await self.system_notification(
+                    guild_id,
+                    f"Database error when checking if role notifications are turned on:\n```\n{notify}\n```",
+                )
+                return
+
+            if notify:
+                await member.send(
+                    f"You do not have the following role anymore: **{role.name}**"
+                )
+
+        except discord.Forbidden:
+            await self.system_notification(
+                guild_id,
+                "Someone tried to remove a role from themselves but I do not have"
+                " permissions to remove it. Ensure that I have a role that is"
+                " hierarchically higher than the role I have to remove, and that I"
+                " have the `Manage Roles` permission.",
+            )
 
 
 def setup(bot):
@@ -1,2 +1,6 @@
+from .async_database import *
+from .cache import *
 from .database import *
+from .instance import *
+from .pool import *
 from .schema import *
@@ -0,0 +1,308 @@
+import asyncio
+import functools
+import inspect
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .database import Database
+
+
+class WriteQueue:
+    """Serialised writer that groups queued mutations into transactions.
+
+    submit() returns a future right away. A single task drains the queue
+    and commits whatever has piled up, up to ``max_batch`` ops and waiting
+    at most ``max_delay`` seconds for more to arrive, through
+    Database.write_batch on the writer thread.
+    """
+
+    def __init__(self, db, max_batch=64, max_delay=0.005):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = asyncio.Queue()
+        self._task = None
+
+        self.batches = 0
+        self.writes = 0
+        self.commit_time = 0.0
+        self.max_commit_time = 0.0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "batches": self.batches,
+            "writes": self.writes,
+            "busy_retries": self.db.sync.busy_retries,
+            "callback_errors": self.db.sync.callback_errors,
+            "checkpoints": self.db.checkpoints,
+            "avg_commit_ms": self.commit_time / self.batches * 1e3
+            if self.batches
+            else 0.0,
+            "max_commit_ms": self.max_commit_time * 1e3,
+        }
+
+    def submit(self, op, *args, **kwargs):
+        if kwargs:
+            op = functools.partial(op, **kwargs)
+        loop = asyncio.get_running_loop()
+        if self._task is None:
+            self._task = loop.create_task(self._run())
+
+        future = loop.create_future()
+        self._queue.put_nowait((op, args, future))
+        return future
+
+    async def flush(self):
+        # Waits until everything submitted so far has been committed
+        if self._task is not None:
+            await self._queue.join()
+
+    async def close(self):
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch):
+        start = time.perf_counter()
+        try:
+            results = await self.db.run_write(
+                self.db.sync.write_batch, [(op, args) for op, args, _ in batch]
+            )
+        except sqlite3.Error as e:
+            # The batch never committed, every caller gets the error back
+            # the same way Database.write returns it
+            results = [e] * len(batch)
+        except Exception as e:
+            # Anything else, such as a shut down executor, is raised to every
+            # caller. The drain task keeps going, later writes would hang
+            # forever without it.
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - start
+        self.batches += 1
+        self.writes += len(batch)
+        self.commit_time += elapsed
+        self.max_commit_time = max(self.max_commit_time, elapsed)
+
+        self.db.schedule_checkpoint()
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception) and not isinstance(result, sqlite3.Error):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class AsyncDatabase:
+    """Awaitable facade over Database.
+
+    Every public Database method is exposed under the same name. Reads run
+    on one dedicated thread, so a slow query or a lock wait never stalls
+    the event loop. Writes go through a WriteQueue and resolve once the
+    transaction they were grouped into has committed. The batches commit on
+    a thread of their own, reads keep using their WAL snapshot meanwhile
+    instead of queueing behind a long write. The wrapped Database
+    is available as ``sync`` for code that is already off the loop.
+
+    The writer does not checkpoint on commit. After a batch commits, a
+    PASSIVE checkpoint is started on a separate maintenance thread if the
+    last one is more than ``checkpoint_interval`` seconds old.
+    """
+
+    database_class = Database
+
+    def __init__(
+        self,
+        database,
+        max_batch=64,
+        max_delay=0.005,
+        checkpoint_interval=30.0,
+        archive=None,
+    ):
+        self.database = database
+        self.sync = self.database_class(
+            database, wal_autocheckpoint=0, archive=archive
+        )
+        self.writes = WriteQueue(self, max_batch, max_delay)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="database"
+        )
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="database-writer"
+        )
+        self._maintenance = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="database-maintenance"
+        )
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = 0
+        self._checkpoint = None
+        self._last_checkpoint = time.monotonic()
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if name.startswith("_") or not inspect.ismethod(attr):
+            return attr
+
+        if name in Database.mutations:
+            op = getattr(self.sync, f"_{name}")
+
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                return await self.writes.submit(op, *args, **kwargs)
+
+        else:
+
+            @functools.wraps(attr)
+            async def method(*args, **kwargs):
+                return await self.run(attr, *args, **kwargs)
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, method)
+        return method
+
+    def manages(self, message_id):
+        # Not a coroutine, the reaction listeners call it on every event
+        return self.sync.manages(message_id)
+
+    def selections_recorded(self, message_id):
+        return self.sync.selections_recorded(message_id)
+
+    async def get_reaction_config(self, message_id):
+        if self.sync.index is not None:
+            # Answered from memory, no need to leave the loop
+            return self.sync.get_reaction_config(message_id)
+        return await self.run(self.sync.get_reaction_config, message_id)
+
+    async def notify(self, guild_id):
+        settings = self.sync.settings.get(guild_id)
+        if settings is not None:
+            return settings.notify
+        return await self.run(self.sync.notify, guild_id)
+
+    async def fetch_systemchannel(self, guild_id):
+        settings = self.sync.settings.get(guild_id)
+        if settings is not None:
+            return settings.systemchannel
+        return await self.run(self.sync.fetch_systemchannel, guild_id)
+
+    async def admin_roles(self, guild_id):
+        roles = self.sync.admins.get(guild_id)
+        if roles is not None:
+            return roles
+        return await self.run(self.sync.admin_roles, guild_id)
+
+    async def get_selection(self, message_id, user_id):
+        selections = self.sync.selections.get(message_id)
+        if selections is not None:
+            return selections.get(user_id)
+        return await self.run(self.sync.get_selection, message_id, user_id)
+
+    async def archive_guilds(self, guild_ids):
+        # Two queued writes, the rows only leave main once the copy committed
+        guild_ids = list(guild_ids)
+        copied = await self.copy_to_archive(guild_ids)
+        if isinstance(copied, Exception):
+            return copied
+        return await self.remove_guilds(guild_ids)
+
+    async def iter_messages(self, chunk_size=None):
+        async for chunk in self._iterate(self.sync.iter_messages, chunk_size):
+            yield chunk
+
+    async def iter_guilds(self, chunk_size=None):
+        async for chunk in self._iterate(self.sync.iter_guilds, chunk_size):
+            yield chunk
+
+    async def _iterate(self, func, chunk_size):
+        # Each page is fetched on the database thread, only one is in memory
+        pages = func() if chunk_size is None else func(chunk_size)
+        while True:
+            chunk = await self.run(next, pages, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def schedule_checkpoint(self):
+        if self._checkpoint is not None and not self._checkpoint.done():
+            return
+        if time.monotonic() - self._last_checkpoint < self.checkpoint_interval:
+            return
+
+        self._last_checkpoint = time.monotonic()
+        self._checkpoint = asyncio.ensure_future(self.checkpoint())
+
+    async def checkpoint(self, mode="PASSIVE"):
+        result = await self.maintain(self.sync.checkpoint, mode)
+        self.checkpoints += 1
+        return result
+
+    async def maintain(self, func, *args, **kwargs):
+        # Like run(), but on the maintenance thread so reads are not queued
+        # behind it
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._maintenance, functools.partial(func, *args, **kwargs)
+        )
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def run_write(self, func, *args, **kwargs):
+        # Like run(), but on the writer thread the WriteQueue commits on
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(func, *args, **kwargs)
+        )
+
+    async def flush(self):
+        await self.writes.flush()
+        if self._checkpoint is not None:
+            await self._checkpoint
+
+    def close(self):
+        # Await flush() first, anything still queued is dropped
+        self._executor.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self._maintenance.shutdown(wait=True)
+        # Leave an empty WAL behind, nothing else checkpoints it
+        self.sync.checkpoint("TRUNCATE")
+        self.sync.close()
@@ -0,0 +1,261 @@
+"""Online backups of reactionlight.db and archive.db.
+
+Snapshots are taken with SQLite's backup API, which copies the database a
+batch of pages at a time and sleeps in between so the bot's own writes are
+never held up for long. Each copy is checked, gzipped and rotated so only
+the newest ``keep`` snapshots stay on disk. The archive database is copied
+next to each snapshot under the same name with ARCHIVE_SUFFIX.
+
+Offline use, from the repository root::
+
+    python -m core.backup backup
+    python -m core.backup list
+    python -m core.backup restore backups/reactionlight-20211010-120000-000000.db.gz
+"""
+import argparse
+import contextlib
+import datetime
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from .instance import InstanceLock
+from .schema import LATEST_VERSION
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DEFAULT_DATABASE = os.path.join(ROOT, "reactionlight.db")
+DEFAULT_DIRECTORY = os.path.join(ROOT, "backups")
+
+# Pages copied per backup step and the pause between steps
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+KEEP_SNAPSHOTS = 7
+
+SNAPSHOT_PREFIX = "reactionlight-"
+SNAPSHOT_SUFFIX = ".db.gz"
+ARCHIVE_SUFFIX = ".archive.gz"
+
+
+class BackupError(Exception):
+    pass
+
+
+def archive_path(path):
+    # The archive copy that belongs to a snapshot
+    return path[: -len(SNAPSHOT_SUFFIX)] + ARCHIVE_SUFFIX
+
+
+def check_integrity(conn):
+    try:
+        result = conn.execute("PRAGMA quick_check;").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"Not an SQLite database: {e}") from e
+
+    if result != "ok":
+        raise BackupError(f"Integrity check failed: {result}")
+
+
+def check(conn):
+    """Returns the dbinfo version of a copy, raising BackupError if unusable."""
+    check_integrity(conn)
+    try:
+        version = conn.execute("SELECT version FROM dbinfo;").fetchone()
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"Not a reactionlight database: {e}") from e
+
+    if version is None:
+        raise BackupError("The database has no dbinfo version")
+    if version[0] > LATEST_VERSION:
+        raise BackupError(
+            f"The database is at version {version[0]}, this bot only knows"
+            f" up to {LATEST_VERSION}"
+        )
+    return version[0]
+
+
+def snapshots(directory=DEFAULT_DIRECTORY):
+    # Oldest first, the timestamp in the name sorts chronologically
+    if not os.path.isdir(directory):
+        return []
+
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)
+    )
+
+
+def rotate(directory=DEFAULT_DIRECTORY, keep=KEEP_SNAPSHOTS):
+    removed = snapshots(directory)[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+        if os.path.exists(archive_path(path)):
+            os.remove(archive_path(path))
+    return removed
+
+
+def _copy(database, path, scratch, checker, pages, sleep):
+    copy = os.path.join(scratch, "backup.db")
+    source = sqlite3.connect(database)
+    target = sqlite3.connect(copy)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+        checker(target)
+    finally:
+        target.close()
+        source.close()
+
+    # Only complete copies ever get their final name
+    partial = os.path.join(scratch, "backup.db.gz")
+    with open(copy, "rb") as src, gzip.open(partial, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(partial, path)
+    os.remove(copy)
+
+
+def snapshot(
+    database=DEFAULT_DATABASE,
+    directory=DEFAULT_DIRECTORY,
+    keep=KEEP_SNAPSHOTS,
+    pages=BACKUP_PAGES,
+    sleep=BACKUP_SLEEP,
+    archive=None,
+):
+    """Writes a gzipped, checked copy of ``database`` and rotates old ones.
+
+    ``archive`` defaults to the archive.db next to ``database`` and is
+    copied first when it exists. Blocks for the whole copy, the bot runs it
+    in an executor. Returns the path of the new snapshot.
+    """
+    if archive is None:
+        archive = os.path.join(os.path.dirname(database), "archive.db")
+    os.makedirs(directory, exist_ok=True)
+    # Microseconds keep two snapshots taken in the same second apart
+    name = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{name}{SNAPSHOT_SUFFIX}")
+
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        # The snapshot itself is written last, a listed snapshot always has
+        # its archive copy next to it
+        if os.path.exists(archive):
+            _copy(archive, archive_path(path), scratch, check_integrity, pages, sleep)
+        _copy(database, path, scratch, check, pages, sleep)
+
+    rotate(directory, keep)
+    return path
+
+
+@contextlib.contextmanager
+def _unpack(path, checker):
+    with tempfile.TemporaryDirectory() as scratch:
+        copy = os.path.join(scratch, "restore.db")
+        try:
+            with gzip.open(path, "rb") as src, open(copy, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        except (OSError, EOFError) as e:
+            raise BackupError(f"Cannot read {path}: {e}") from e
+
+        conn = sqlite3.connect(copy)
+        try:
+            yield conn, checker(conn)
+        finally:
+            conn.close()
+
+
+@contextlib.contextmanager
+def unpack(path):
+    """Yields a connection to a checked, decompressed copy of a snapshot
+    together with its dbinfo version, and one to its archive copy or None
+    for snapshots taken without an archive."""
+    with contextlib.ExitStack() as stack:
+        source, version = stack.enter_context(_unpack(path, check))
+        archive = None
+        if os.path.exists(archive_path(path)):
+            archive, _ = stack.enter_context(
+                _unpack(archive_path(path), check_integrity)
+            )
+        yield source, version, archive
+
+
+def restore(path, database=DEFAULT_DATABASE, pages=BACKUP_PAGES, archive=None):
+    """Replaces ``database`` and its archive with a snapshot. The bot must not
+    be running, it restores through Database.restore instead."""
+    if archive is None:
+        archive = os.path.join(os.path.dirname(database), "archive.db")
+    with unpack(path) as (source, _, archive_source):
+        copies = [(source, database)]
+        if archive_source is not None:
+            copies.append((archive_source, archive))
+        for conn, file in copies:
+            target = sqlite3.connect(file)
+            try:
+                conn.backup(target, pages=pages)
+            finally:
+                target.close()
+
+
+def restore_online(db, path):
+    """Restores a snapshot into the running bot's Database.
+
+    Only snapshots at LATEST_VERSION are accepted: the bot has already
+    migrated and would not migrate the restored copy again. Call it on the
+    database thread after flushing queued writes.
+    """
+    with unpack(path) as (source, version, archive):
+        if version != LATEST_VERSION:
+            raise BackupError(
+                f"The snapshot is at version {version}, the bot is at"
+                f" {LATEST_VERSION}. Restore it offline instead."
+            )
+        return db.restore(source, archive)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m core.backup",
+        description="Back up or restore reactionlight.db and its archive.",
+    )
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument(
+        "--archive", help="archive database, defaults to the one next to --database"
+    )
+    parser.add_argument("--directory", default=DEFAULT_DIRECTORY)
+    commands = parser.add_subparsers(dest="command", required=True)
+    backup = commands.add_parser("backup", help="take a snapshot")
+    backup.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    commands.add_parser("list", help="list snapshots")
+    restore_parser = commands.add_parser("restore", help="restore a snapshot")
+    restore_parser.add_argument("snapshot")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "backup":
+            start = time.perf_counter()
+            path = snapshot(
+                args.database, args.directory, args.keep, archive=args.archive
+            )
+            print(
+                f"Wrote {path} ({os.path.getsize(path)} bytes)"
+                f" in {time.perf_counter() - start:.2f}s"
+            )
+        elif args.command == "list":
+            for path in snapshots(args.directory):
+                print(f"{os.path.basename(path)}\t{os.path.getsize(path)}")
+        else:
+            lock = InstanceLock(args.database)
+            if not lock.acquire():
+                parser.exit(1, f"{args.database} is in use by the bot, stop it first\n")
+            try:
+                restore(args.snapshot, args.database, archive=args.archive)
+            finally:
+                lock.release()
+            print(f"Restored {args.database} from {args.snapshot}")
+    except (BackupError, sqlite3.Error) as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+from typing import Dict, NamedTuple
+
+
+class ReactionRoleEntry(NamedTuple):
+    reactionrole_id: int
+    limit_to_one: int
+    guild_id: int
+    reactions: Dict[str, int]
+
+
+class ReactionRoleIndex:
+    """In-memory copy of the messages and reactionroles tables.
+
+    Maps message_id to a ReactionRoleEntry. Entries are never mutated in
+    place; every change swaps in a new entry so the event loop can read the
+    index while the database thread updates it.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def __contains__(self, message_id):
+        return message_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, message_id):
+        return self._entries.get(message_id)
+
+    def load(self, cursor):
+        cursor.execute(
+            "SELECT message_id, reactionrole_id, limit_to_one, guild_id FROM messages;"
+        )
+        messages = cursor.fetchall()
+        reactions = {message[1]: {} for message in messages}
+        cursor.execute(
+            "SELECT reactionrole_id, reaction, role_id FROM reactionroles;")
+        for reactionrole_id, reaction, role_id in cursor:
+            if reactionrole_id in reactions:
+                reactions[reactionrole_id][reaction] = role_id
+
+        self._entries = {
+            message_id: ReactionRoleEntry(
+                reactionrole_id, limit_to_one, guild_id, reactions[reactionrole_id]
+            )
+            for message_id, reactionrole_id, limit_to_one, guild_id in messages
+        }
+
+    def add(self, message_id, reactionrole_id, limit_to_one, guild_id, reactions):
+        self._entries[message_id] = ReactionRoleEntry(
+            reactionrole_id, limit_to_one, guild_id, dict(reactions)
+        )
+
+    def discard(self, message_id):
+        self._entries.pop(message_id, None)
+
+    def set_guild(self, message_id, guild_id):
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            self._entries[message_id] = entry._replace(guild_id=guild_id)
+
+    def set_reaction(self, message_id, reaction, role_id):
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            reactions = dict(entry.reactions)
+            reactions[reaction] = role_id
+            self._entries[message_id] = entry._replace(reactions=reactions)
+
+    def remove_reaction(self, message_id, reaction):
+        entry = self._entries.get(message_id)
+        if entry is not None and reaction in entry.reactions:
+            reactions = dict(entry.reactions)
+            del reactions[reaction]
+            self._entries[message_id] = entry._replace(reactions=reactions)
+
+    def diff(self, other):
+        # Returns (message_id, ours, theirs) for every entry that differs
+        mismatches = []
+        for message_id in self._entries.keys() | other._entries.keys():
+            ours = self._entries.get(message_id)
+            theirs = other._entries.get(message_id)
+            if ours != theirs:
+                mismatches.append((message_id, ours, theirs))
+        return mismatches
+
+
+class ManagedMessages:
+    """Set of the message ids of every reaction-role message.
+
+    The reaction listeners check it before anything else, so reactions on
+    the messages the bot does not manage cost one set lookup. It is exact
+    rather than a bloom filter, a few dozen bytes per message is small
+    enough. Like the index it is only swapped or updated after a commit.
+    """
+
+    def __init__(self):
+        self._ids = set()
+
+    def __contains__(self, message_id):
+        return message_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def load(self, cursor):
+        cursor.execute("SELECT message_id FROM messages;")
+        self._ids = {row[0] for row in cursor}
+
+    def add(self, message_id):
+        self._ids.add(message_id)
+
+    def discard(self, message_id):
+        self._ids.discard(message_id)
+
+
+class ReactionSelections:
+    """The reaction every user has selected on limit-to-one messages, loaded
+    per message on first use.
+
+    Maps message_id to {user_id: reaction}. Selection changes are applied to
+    loaded messages once their transaction has committed. Loads run on the
+    reader thread while commits land on the writer's, so every change bumps
+    a generation and a load that overlapped one is not kept.
+    """
+
+    def __init__(self):
+        self._messages = {}
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._messages)
+
+    def get(self, message_id):
+        return self._messages.get(message_id)
+
+    def load(self, cursor, message_id):
+        generation = self._generation
+        cursor.execute(
+            "SELECT user_id, reaction FROM reaction_selections WHERE message_id = ?;",
+            (message_id,),
+        )
+        selections = dict(cursor.fetchall())
+        if generation == self._generation:
+            self._messages[message_id] = selections
+        return selections
+
+    def set(self, message_id, user_id, reaction):
+        self._generation += 1
+        selections = self._messages.get(message_id)
+        if selections is not None:
+            selections[user_id] = reaction
+
+    def discard(self, message_id, user_id):
+        self._generation += 1
+        selections = self._messages.get(message_id)
+        if selections is not None:
+            selections.pop(user_id, None)
+
+    def invalidate(self, message_id):
+        self._generation += 1
+        self._messages.pop(message_id, None)
+
+
+class GuildSettings(NamedTuple):
+    notify: int
+    systemchannel: int
+
+
+# What a guild without a guild_settings row behaves like
+DEFAULT_GUILD_SETTINGS = GuildSettings(notify=0, systemchannel=0)
+
+
+class GuildSettingsCache:
+    """guild_settings rows keyed by guild_id, loaded lazily on first use.
+
+    Guilds without a row are cached as DEFAULT_GUILD_SETTINGS, so reading
+    the settings never writes. Anything that changes a row must call
+    invalidate() once its transaction has committed, a load that overlapped
+    an invalidation is returned but not kept.
+    """
+
+    def __init__(self):
+        self._settings = {}
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._settings)
+
+    def get(self, guild_id):
+        return self._settings.get(guild_id)
+
+    def load(self, cursor, guild_id):
+        generation = self._generation
+        cursor.execute(
+            "SELECT notify, systemchannel FROM guild_settings WHERE guild_id = ?;",
+            (guild_id,),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            settings = DEFAULT_GUILD_SETTINGS
+        else:
+            settings = GuildSettings(row[0] or 0, row[1] or 0)
+
+        if generation == self._generation:
+            self._settings[guild_id] = settings
+        return settings
+
+    def invalidate(self, guild_id):
+        self._generation += 1
+        self._settings.pop(guild_id, None)
+
+
+class AdminRoleCache:
+    """frozenset of admin role ids per guild, loaded lazily on first use.
+
+    add_admin, remove_admin and remove_guild invalidate the guild once their
+    transaction has committed. Like GuildSettingsCache it does not keep a load
+    that overlapped an invalidation.
+    """
+
+    def __init__(self):
+        self._roles = {}
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._roles)
+
+    def get(self, guild_id):
+        return self._roles.get(guild_id)
+
+    def load(self, cursor, guild_id):
+        generation = self._generation
+        cursor.execute("SELECT role_id FROM admins WHERE guild_id = ?;", (guild_id,))
+        roles = frozenset(row[0] for row in cursor)
+        if generation == self._generation:
+            self._roles[guild_id] = roles
+        return roles
+
+    def invalidate(self, guild_id):
+        self._generation += 1
+        self._roles.pop(guild_id, None)
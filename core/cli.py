@@ -0,0 +1,399 @@
+"""Operator commands that work on reactionlight.db without starting the bot.
+
+Run from the repository root::
+
+    python -m core stats
+    python -m core migrate
+    python -m core vacuum
+    python -m core export -o configs.json
+    python -m core import configs.json
+    python -m core purge 1234 5678
+
+Writes go through Database like the bot's own, every command that changes
+rows does so in a single transaction. stats and export only read and work
+next to the running bot. The other commands change rows behind its
+in-memory caches, so they refuse to run until the bot is stopped.
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+
+from .backup import DEFAULT_DATABASE
+from .database import Database, DuplicateInstance, FileStats
+from .instance import InstanceLock
+from .schema import LATEST_VERSION, SchemaHandler
+
+EXPORT_VERSION = 1
+
+
+@contextlib.contextmanager
+def bot_stopped(args):
+    # Held for the whole command, so the bot cannot start halfway through
+    lock = InstanceLock(args.database)
+    if not lock.acquire():
+        owner = lock.owner
+        raise SystemExit(
+            f"{args.database} is in use by the bot"
+            + (f" (pid {owner})" if owner else "")
+            + ", stop it first"
+        )
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def open_database(args):
+    if not os.path.exists(args.database):
+        raise SystemExit(f"{args.database} does not exist")
+    return Database(args.database, use_index=False, archive=args.archive)
+
+
+@contextlib.contextmanager
+def read_only(args):
+    """Yields a cursor on a read-only connection with the archive attached if
+    it exists.
+
+    Unlike Database it creates no tables, so it can run next to the bot.
+    """
+    if not os.path.exists(args.database):
+        raise SystemExit(f"{args.database} does not exist")
+
+    def uri(path):
+        return f"{pathlib.Path(path).resolve().as_uri()}?mode=ro"
+
+    conn = sqlite3.connect(uri(args.database), uri=True)
+    try:
+        if args.archive is not None and os.path.exists(args.archive):
+            conn.execute("ATTACH DATABASE ? AS archive;", (uri(args.archive),))
+        yield conn.cursor()
+    except sqlite3.Error as e:
+        raise SystemExit(f"Cannot read {args.database}: {e}")
+    finally:
+        conn.close()
+
+
+def stats(args):
+    with read_only(args) as cursor:
+        cursor.execute("SELECT version FROM dbinfo;")
+        version = cursor.fetchone()
+        print(f"Schema version: {version[0] if version else 'unknown'}")
+        pragmas = []
+        for pragma in FileStats._fields[2:]:
+            cursor.execute(f"PRAGMA {pragma};")
+            pragmas.append(cursor.fetchone()[0])
+        wal = f"{args.database}-wal"
+        file_stats = FileStats(
+            os.path.getsize(args.database),
+            os.path.getsize(wal) if os.path.exists(wal) else 0,
+            *pragmas,
+        )
+        print(
+            f"File: {file_stats.size} bytes, WAL {file_stats.wal_size} bytes,"
+            f" {file_stats.freelist_count} of {file_stats.page_count} pages free"
+        )
+
+        print("\nRows per table")
+        tables = [
+            "messages",
+            "reactionroles",
+            "admins",
+            "guild_settings",
+            "cleanup_queue_guilds",
+            "reaction_selections",
+        ]
+        cursor.execute("PRAGMA database_list;")
+        if "archive" in [row[1] for row in cursor.fetchall()]:
+            tables += [
+                f"archive.{table}"
+                for table in ("messages", "reactionroles", "admins", "guild_settings")
+            ]
+        for table in tables:
+            cursor.execute(f"SELECT COUNT(*) FROM {table};")
+            print(f"  {table:<28}{cursor.fetchone()[0]:>10}")
+
+        cursor.execute(
+            "SELECT messages.guild_id, COUNT(DISTINCT messages.reactionrole_id),"
+            " COUNT(reactionroles.reaction) FROM messages LEFT JOIN reactionroles ON"
+            " reactionroles.reactionrole_id = messages.reactionrole_id GROUP BY"
+            " messages.guild_id;"
+        )
+        guilds = {
+            guild_id: [messages, reactions, 0]
+            for guild_id, messages, reactions in cursor.fetchall()
+        }
+        cursor.execute("SELECT guild_id, COUNT(*) FROM admins GROUP BY guild_id;")
+        for guild_id, admins in cursor.fetchall():
+            guilds.setdefault(guild_id, [0, 0, 0])[2] = admins
+
+    if args.guild:
+        rows = [(guild_id, guilds.get(guild_id, [0, 0, 0])) for guild_id in args.guild]
+    else:
+        rows = sorted(guilds.items(), key=lambda item: item[1], reverse=True)
+        rows = rows[: args.top]
+
+    print(f"\nRows per guild ({len(guilds)} guilds)")
+    print(f"  {'guild':<22}{'messages':>10}{'reactions':>11}{'admins':>8}")
+    for guild_id, (messages, reactions, admins) in rows:
+        print(f"  {str(guild_id):<22}{messages:>10}{reactions:>11}{admins:>8}")
+
+
+def migrate(args):
+    if not os.path.exists(args.database):
+        raise SystemExit(f"{args.database} does not exist")
+
+    # Without a gateway the steps that look up guilds are left for the bot
+    handler = SchemaHandler(args.database, None)
+    try:
+        handler.migrate(gateway=False)
+    finally:
+        handler.close()
+
+    for step, elapsed in handler.timings.items():
+        print(f"Applied {step} in {elapsed:.3f}s")
+    pending = handler.pending()
+    if pending:
+        print(
+            f"At version {handler.version}, {', '.join(pending)} need the gateway"
+            " and run when the bot starts"
+        )
+    else:
+        print(f"At version {LATEST_VERSION}, nothing left to migrate")
+
+
+def vacuum(args):
+    db = open_database(args)
+    before = db.file_stats()
+    start = time.perf_counter()
+    # Rewrites the file with incremental auto_vacuum enabled, then refreshes
+    # the planner statistics
+    steps = (
+        db.enable_incremental_vacuum,
+        db.optimize,
+        functools.partial(db.checkpoint, "TRUNCATE"),
+    )
+    for step in steps:
+        error = step()
+        if isinstance(error, Exception):
+            db.close()
+            raise SystemExit(f"Database error: {error}")
+    after = db.file_stats()
+    db.close()
+    print(
+        f"Vacuumed in {time.perf_counter() - start:.2f}s: {before.size} ->"
+        f" {after.size} bytes, {before.freelist_count} -> {after.freelist_count}"
+        " free pages"
+    )
+
+
+def export(args):
+    guilds = {}
+    with read_only(args) as cursor:
+        cursor.execute(
+            "SELECT messages.message_id, messages.channel, messages.guild_id,"
+            " messages.limit_to_one, reactionroles.reaction, reactionroles.role_id"
+            " FROM messages LEFT JOIN reactionroles ON reactionroles.reactionrole_id"
+            " = messages.reactionrole_id ORDER BY messages.reactionrole_id;"
+        )
+        messages = {}
+        for message_id, channel, guild_id, limit_to_one, reaction, role_id in cursor:
+            if message_id not in messages:
+                messages[message_id] = {
+                    "message_id": message_id,
+                    "channel_id": channel,
+                    "limit_to_one": limit_to_one,
+                    "reactions": {},
+                }
+                guild = guilds.setdefault(guild_id, {"messages": []})
+                guild["messages"].append(messages[message_id])
+            if reaction is not None:
+                messages[message_id]["reactions"][reaction] = role_id
+
+        cursor.execute("SELECT guild_id, role_id FROM admins;")
+        for guild_id, role_id in cursor.fetchall():
+            guilds.setdefault(guild_id, {"messages": []}).setdefault(
+                "admins", []
+            ).append(role_id)
+        cursor.execute("SELECT guild_id, notify, systemchannel FROM guild_settings;")
+        for guild_id, notify, systemchannel in cursor.fetchall():
+            guilds.setdefault(guild_id, {"messages": []})["settings"] = {
+                "notify": notify or 0,
+                "systemchannel": systemchannel or 0,
+            }
+
+    if args.guild:
+        guilds = {
+            guild_id: guilds[guild_id] for guild_id in args.guild if guild_id in guilds
+        }
+
+    data = {
+        "version": EXPORT_VERSION,
+        "guilds": [
+            {"guild_id": guild_id, "admins": [], "settings": None, **guild}
+            for guild_id, guild in guilds.items()
+        ],
+    }
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        json.dump(data, output, indent=2, ensure_ascii=False)
+        output.write("\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    count = sum(len(guild["messages"]) for guild in data["guilds"])
+    print(f"Exported {count} messages of {len(data['guilds'])} guilds", file=sys.stderr)
+
+
+def import_configs(db, tx, guilds, replace):
+    # One write op for the whole file, so any failure rolls all of it back
+    imported = {"messages": 0, "skipped": 0, "admins": 0, "settings": 0}
+    for guild in guilds:
+        guild_id = guild["guild_id"]
+        for message in guild.get("messages", ()):
+            if replace:
+                db._delete(tx, message["message_id"])
+            try:
+                db._add_reaction_role(
+                    tx,
+                    {
+                        "message": {
+                            "message_id": message["message_id"],
+                            "channel_id": message["channel_id"],
+                            "guild_id": guild_id,
+                        },
+                        "limit_to_one": message.get("limit_to_one", 0),
+                        "reactions": message["reactions"],
+                    },
+                )
+                imported["messages"] += 1
+            except DuplicateInstance:
+                imported["skipped"] += 1
+
+        for role_id in guild.get("admins", ()):
+            tx.cursor.execute(
+                "SELECT 1 FROM admins WHERE role_id = ? AND guild_id = ?;",
+                (role_id, guild_id),
+            )
+            if not tx.cursor.fetchone():
+                db._add_admin(tx, role_id, guild_id)
+                imported["admins"] += 1
+
+        settings = guild.get("settings")
+        if settings:
+            db._add_systemchannel(tx, guild_id, settings.get("systemchannel", 0))
+            tx.cursor.execute(
+                "UPDATE guild_settings SET notify = ? WHERE guild_id = ?;",
+                (settings.get("notify", 0), guild_id),
+            )
+            imported["settings"] += 1
+    return imported
+
+
+def import_(args):
+    with open(args.file, encoding="utf-8") as file:
+        data = json.load(file)
+    if data.get("version") != EXPORT_VERSION:
+        raise SystemExit(f"Unsupported export version {data.get('version')}")
+
+    db = open_database(args)
+    try:
+        result = db.write(
+            functools.partial(import_configs, db), data["guilds"], args.replace
+        )
+    except (KeyError, TypeError) as e:
+        result = ValueError(f"malformed export, missing {e}")
+    finally:
+        db.close()
+    if isinstance(result, Exception):
+        raise SystemExit(f"Nothing was imported: {result}")
+
+    print(
+        f"Imported {result['messages']} messages, {result['admins']} admin roles"
+        f" and the settings of {result['settings']} guilds"
+        + (
+            f", skipped {result['skipped']} existing messages"
+            if result["skipped"]
+            else ""
+        )
+    )
+
+
+def purge(args):
+    db = open_database(args)
+    archived = args.archive_rows and db.archive is not None
+    if archived:
+        result = db.archive_guilds(args.guild_ids)
+    else:
+        result = db.remove_guilds(args.guild_ids)
+    db.close()
+    if isinstance(result, Exception):
+        raise SystemExit(f"Database error: {result}")
+
+    action = "Archived" if archived else "Purged"
+    print(
+        f"{action} {len(args.guild_ids)} guilds: "
+        + ", ".join(f"{table}={count}" for table, count in result.items())
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m core", description="Inspect and maintain reactionlight.db."
+    )
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument(
+        "--archive",
+        default=os.path.join(os.path.dirname(DEFAULT_DATABASE), "archive.db"),
+        help="archive database attached like the bot does",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = commands.add_parser("stats", help="rows per table and guild")
+    stats_parser.add_argument("--guild", type=int, nargs="+")
+    stats_parser.add_argument("--top", type=int, default=20)
+    stats_parser.set_defaults(func=stats)
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="apply the schema steps that do not need the gateway"
+    )
+    migrate_parser.set_defaults(func=migrate)
+
+    vacuum_parser = commands.add_parser("vacuum", help="rewrite and optimize the file")
+    vacuum_parser.set_defaults(func=vacuum)
+
+    export_parser = commands.add_parser("export", help="write configs as JSON")
+    export_parser.add_argument("--guild", type=int, nargs="+")
+    export_parser.add_argument("-o", "--output")
+    export_parser.set_defaults(func=export)
+
+    import_parser = commands.add_parser("import", help="read configs from JSON")
+    import_parser.add_argument("file")
+    import_parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="overwrite messages that are already set up instead of skipping them",
+    )
+    import_parser.set_defaults(func=import_)
+
+    purge_parser = commands.add_parser("purge", help="delete every row of guilds")
+    purge_parser.add_argument("guild_ids", type=int, nargs="+")
+    purge_parser.add_argument(
+        "--archive-rows",
+        action="store_true",
+        help="move the rows to the archive instead of deleting them",
+    )
+    purge_parser.set_defaults(func=purge)
+
+    args = parser.parse_args(argv)
+    if args.func in (stats, export):
+        args.func(args)
+        return
+    with bot_stopped(args):
+        args.func(args)
@@ -1,17 +1,33 @@
+import itertools
+import os
 import sqlite3
-from random import randint
+import time
+from typing import Dict, NamedTuple, Optional
+
+from .cache import (
+    AdminRoleCache,
+    GuildSettingsCache,
+    ManagedMessages,
+    ReactionRoleIndex,
+    ReactionSelections,
+)
+from .pool import WAL_AUTOCHECKPOINT, ConnectionPool
 
 
 def initialize(database):
     conn = sqlite3.connect(database)
     cursor = conn.cursor()
+    # Only takes effect on a new file, Database.enable_incremental_vacuum
+    # converts existing ones
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL;")
     cursor.execute(
         "CREATE TABLE IF NOT EXISTS 'messages' ('message_id' INT, 'channel' INT,"
-        " 'reactionrole_id' INT, 'guild_id' INT, 'limit_to_one' INT);"
+        " 'reactionrole_id' INTEGER PRIMARY KEY, 'guild_id' INT, 'limit_to_one' INT);"
     )
     cursor.execute(
-        "CREATE TABLE IF NOT EXISTS 'reactionroles' ('reactionrole_id' INT, 'reaction'"
-        " NVCARCHAR, 'role_id' INT);"
+        "CREATE TABLE IF NOT EXISTS 'reactionroles' ('reactionrole_id' INTEGER NOT NULL"
+        " REFERENCES messages (reactionrole_id) ON DELETE CASCADE, 'reaction'"
+        " NVCARCHAR NOT NULL, 'role_id' INT, UNIQUE (reactionrole_id, reaction));"
     )
     cursor.execute(
         "CREATE TABLE IF NOT EXISTS 'admins' ('role_id' INT, 'guild_id' INT);"
@@ -24,10 +40,12 @@ def initialize(database):
         "CREATE TABLE IF NOT EXISTS 'guild_settings' ('guild_id' INT, 'notify' INT, 'systemchannel' INT);"
     )
     cursor.execute(
-        "CREATE UNIQUE INDEX IF NOT EXISTS guild_id_idx ON guild_settings (guild_id);"
+        "CREATE TABLE IF NOT EXISTS 'reaction_selections' ('message_id' INT NOT NULL,"
+        " 'user_id' INT NOT NULL, 'reaction' NVCARCHAR NOT NULL, PRIMARY KEY"
+        " (message_id, user_id)) WITHOUT ROWID;"
     )
     cursor.execute(
-        "CREATE UNIQUE INDEX IF NOT EXISTS reactionrole_idx ON messages (reactionrole_id);"
+        "CREATE UNIQUE INDEX IF NOT EXISTS guild_id_idx ON guild_settings (guild_id);"
     )
     cursor.execute(
         "CREATE UNIQUE INDEX IF NOT EXISTS guild_id_index ON cleanup_queue_guilds (guild_id);"
@@ -37,358 +55,919 @@ def initialize(database):
     conn.close()
 
 
+def initialize_archive(cursor):
+    # Tables of the attached archive database. Archived messages get ids of
+    # their own, reactionrole_ids are reused in the hot tables once freed.
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS archive.messages ('archive_id' INTEGER PRIMARY"
+        " KEY, 'message_id' INT, 'channel' INT, 'reactionrole_id' INT, 'guild_id'"
+        " INT, 'limit_to_one' INT, 'archived_at' INT);"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS archive.reactionroles ('archive_id' INT NOT"
+        " NULL, 'reaction' NVCARCHAR NOT NULL, 'role_id' INT);"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS archive.admins ('role_id' INT, 'guild_id' INT);"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS archive.guild_settings ('guild_id' INTEGER"
+        " PRIMARY KEY, 'notify' INT, 'systemchannel' INT);"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS archive.messages_guild_id_idx ON messages"
+        " (guild_id);"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS archive.reactionroles_archive_id_idx ON"
+        " reactionroles (archive_id);"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS archive.admins_guild_id_idx ON admins (guild_id);"
+    )
+
+
+# Rows per page of iter_messages and iter_guilds
+CHUNK_SIZE = 500
+
+# Upper bound on the rows PRAGMA optimize samples per index
+ANALYSIS_LIMIT = 1000
+
+# Retries of a write batch while another connection holds the lock
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05
+BUSY_BACKOFF_MAX = 1.0
+
+# Milliseconds since the Unix epoch at Discord snowflake 0
+DISCORD_EPOCH = 1420070400000
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and (
+        "locked" in str(error) or "busy" in str(error)
+    )
+
+
 class DuplicateInstance(Exception):
     pass
 
 
+class Transaction:
+    """Cursor of a write batch plus the cache updates to run once it commits."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.callbacks = []
+
+    def on_commit(self, func, *args):
+        self.callbacks.append((func, args))
+
+
+class ReactionConfig(NamedTuple):
+    exists: bool
+    limit_to_one: int
+    guild_id: Optional[int]
+    reactions: Dict[str, int]
+
+
+class FileStats(NamedTuple):
+    size: int
+    wal_size: int
+    page_size: int
+    page_count: int
+    freelist_count: int
+    auto_vacuum: int
+
+
 class Database:
-    def __init__(self, database):
+    pool_class = ConnectionPool
+
+    # Public methods that write, AsyncDatabase queues these instead of
+    # running them directly. Each one has a ``_name`` op for write_batch.
+    mutations = frozenset(
+        {
+            "add_reaction_role",
+            "add_guild",
+            "remove_guild",
+            "remove_guilds",
+            "copy_to_archive",
+            "restore_guild",
+            "delete",
+            "add_admin",
+            "remove_admin",
+            "add_systemchannel",
+            "remove_systemchannel",
+            "add_reaction",
+            "remove_reaction",
+            "add_cleanup_guild",
+            "remove_cleanup_guild",
+            "toggle_notify",
+            "set_selection",
+            "clear_selection",
+        }
+    )
+
+    def __init__(
+        self,
+        database,
+        use_index=True,
+        wal_autocheckpoint=WAL_AUTOCHECKPOINT,
+        archive=None,
+    ):
         self.database = database
+        self.archive = archive
         initialize(self.database)
+        self.pool = self.pool_class(
+            self.database,
+            wal_autocheckpoint,
+            {"archive": archive} if archive is not None else None,
+        )
+        if archive is not None:
+            with self.pool.writer() as cursor:
+                initialize_archive(cursor)
+        self.settings = GuildSettingsCache()
+        self.admins = AdminRoleCache()
+        self.selections = ReactionSelections()
+        self.busy_retries = 0
+        self.callback_errors = 0
+        self.managed = ManagedMessages()
+        self.index = ReactionRoleIndex() if use_index else None
+        # When five_to_six started storing selections, read with the index
+        self.selections_since = None
+        # The index fails on schemas older than v3, the bot reloads it once
+        # SchemaHandler has migrated the file
+        self.reload_index()
 
         self.reactionrole_creation = {}
 
-    def add_reaction_role(self, rl_dict: dict):
+    def close(self):
+        self.pool.close()
+
+    def restore(self, source, archive=None):
+        """Overwrites the database with ``source``, an open sqlite3 connection,
+        and the archive database with ``archive`` if both are given.
+
+        Runs on the writer connection so no write can interleave, then drops
+        every cache since none of them match the new contents.
+        """
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            if self.exists(rl_dict["message"]["message_id"]):
-                raise DuplicateInstance("The message id is already in use!")
-            while True:
-                try:
-                    reactionrole_id = randint(0, 100000)
-                    cursor.execute(
-                        "INSERT INTO 'messages' ('message_id', 'channel', 'reactionrole_id',"
-                        " 'guild_id', 'limit_to_one') values(?, ?, ?, ?, ?);",
-                        (
-                            rl_dict["message"]["message_id"],
-                            rl_dict["message"]["channel_id"],
-                            reactionrole_id,
-                            rl_dict["message"]["guild_id"],
-                            rl_dict["limit_to_one"],
-                        ),
-                    )
-                    break
-                except sqlite3.IntegrityError:
-                    continue
-            combos = [
-                (reactionrole_id, reaction, role_id)
-                for reaction, role_id in rl_dict["reactions"].items()
-            ]
-            cursor.executemany(
-                "INSERT INTO 'reactionroles' ('reactionrole_id', 'reaction', 'role_id') values(?, ?, ?);",
-                combos,
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with self.pool.writer() as cursor:
+                source.backup(cursor.connection)
+                if archive is not None and self.archive is not None:
+                    # backup() only writes to the main schema of its target
+                    target = sqlite3.connect(self.archive)
+                    try:
+                        archive.backup(target)
+                    finally:
+                        target.close()
+
         except sqlite3.Error as e:
             return e
 
-    def exists(self, message_id):
+        self.settings = GuildSettingsCache()
+        self.admins = AdminRoleCache()
+        self.selections = ReactionSelections()
+        return self.reload_index()
+
+    def file_stats(self):
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM messages WHERE message_id = ?;", (message_id,)
-            )
-            result = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            return result
+            with self.pool.reader() as cursor:
+                pragmas = []
+                for pragma in FileStats._fields[2:]:
+                    cursor.execute(f"PRAGMA {pragma};")
+                    pragmas.append(cursor.fetchone()[0])
 
         except sqlite3.Error as e:
             return e
 
-    def get_reactions(self, message_id):
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT reactionrole_id FROM messages WHERE message_id = ?;",
-                (message_id,),
-            )
-            reactionrole_id = cursor.fetchall()[0][0]
-            cursor.execute(
-                "SELECT reaction, role_id FROM reactionroles WHERE reactionrole_id"
-                " = ?;",
-                (reactionrole_id,),
-            )
-            combos = {}
-            for row in cursor:
-                reaction = row[0]
-                role_id = row[1]
-                combos[reaction] = role_id
+        wal = f"{self.database}-wal"
+        return FileStats(
+            os.path.getsize(self.database),
+            os.path.getsize(wal) if os.path.exists(wal) else 0,
+            *pragmas,
+        )
 
-            cursor.close()
-            conn.close()
-            return combos
+    def optimize(self):
+        # Refreshes planner statistics where SQLite thinks they are stale,
+        # sampling at most ANALYSIS_LIMIT rows per index
+        try:
+            with self.pool.writer() as cursor:
+                cursor.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT};")
+                cursor.execute("PRAGMA optimize;")
 
         except sqlite3.Error as e:
             return e
 
-    def isunique(self, message_id):
+    def enable_incremental_vacuum(self):
+        # auto_vacuum can only change on an existing file through a full
+        # VACUUM, so this rewrites the database once
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT limit_to_one FROM messages WHERE message_id = ?;",
-                (message_id,),
-            )
-            unique = cursor.fetchall()[0][0]
-            cursor.close()
-            conn.close()
-            return unique
+            with self.pool.writer() as cursor:
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+                cursor.execute("VACUUM;")
+
         except sqlite3.Error as e:
             return e
 
-    def fetch_messages(self, channel):
+    def incremental_vacuum(self, pages):
+        """Returns up to ``pages`` free pages to the filesystem in one short
+        write transaction, and the number of free pages left."""
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT message_id FROM messages WHERE channel = ?;", (
-                    channel,)
-            )
-            all_messages_in_channel = []
-            for row in cursor:
-                message_id = int(row[0])
-                all_messages_in_channel.append(message_id)
-
-            cursor.close()
-            conn.close()
-            return all_messages_in_channel
+            with self.pool.writer() as cursor:
+                # execute() would only free one page, the pragma frees a
+                # page per step and returns no rows
+                cursor.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+                cursor.execute("PRAGMA freelist_count;")
+                return cursor.fetchone()[0]
 
         except sqlite3.Error as e:
             return e
 
-    def fetch_all_messages(self):
+    def quick_check(self, max_errors=10):
+        # ["ok"] when the database is healthy
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM messages;")
-            all_messages = cursor.fetchall()
-
-            cursor.close()
-            conn.close()
-            return all_messages
+            with self.pool.reader() as cursor:
+                cursor.execute(f"PRAGMA quick_check({int(max_errors)});")
+                return [row[0] for row in cursor]
 
         except sqlite3.Error as e:
             return e
 
-    def add_guild(self, channel_id, guild_id):
+    def checkpoint(self, mode="PASSIVE"):
+        # Copies committed WAL frames back into the database file. PASSIVE
+        # never waits on readers or the writer.
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE messages SET guild_id = ? WHERE channel = ?;",
-                (guild_id, channel_id),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
+            return self.pool.checkpoint(mode)
 
         except sqlite3.Error as e:
             return e
 
-    def remove_guild(self, guild_id):
+    def write(self, op, *args):
+        # Runs one mutation in its own transaction
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            # Deleting the guilds reaction-role database entries
-            cursor.execute(
-                "SELECT reactionrole_id FROM messages WHERE guild_id = ?;",
-                (guild_id,),
-            )
-            results = cursor.fetchall()
-            if results:
-                for result in results:
-                    reactionrole_id = result[0]
-                    cursor.execute(
-                        "DELETE FROM messages WHERE reactionrole_id = ?;",
-                        (reactionrole_id,),
-                    )
-                    cursor.execute(
-                        "DELETE FROM reactionroles WHERE reactionrole_id = ?;",
-                        (reactionrole_id,),
-                    )
-            # Deleting the guilds guild_settings database entries
-            cursor.execute(
-                "DELETE FROM guild_settings WHERE guild_id = ?;",
-                (guild_id,),
-            )
-            # Delete the guilds admin roles
-            cursor.execute(
-                "DELETE FROM admins WHERE guild_id = ?;",
-                (guild_id,),
-            )
-            # Delete the guilds potencial cleanup_queue entries
-            cursor.execute(
-                "DELETE FROM cleanup_queue_guilds WHERE guild_id=?;", (
-                    guild_id,)
+            result = self.write_batch([(op, args)])[0]
+        except sqlite3.Error as e:
+            return e
+
+        if isinstance(result, Exception) and not isinstance(result, sqlite3.Error):
+            raise result
+        return result
+
+    def write_batch(self, ops):
+        """Runs ``(op, args)`` pairs in a single transaction.
+
+        Each op runs under its own savepoint, so one that raises is rolled
+        back on its own and gets the exception as its result. The whole batch
+        is retried with exponential backoff while SQLite reports the database
+        as busy. Returns one result per op.
+        """
+        delay = BUSY_BACKOFF
+        for attempt in itertools.count():
+            try:
+                return self._write_batch(ops)
+            except sqlite3.OperationalError as e:
+                if not is_busy(e) or attempt >= BUSY_RETRIES:
+                    raise
+                self.busy_retries += 1
+                time.sleep(delay)
+                delay = min(delay * 2, BUSY_BACKOFF_MAX)
+
+    def _write_batch(self, ops):
+        results = []
+        callbacks = []
+        with self.pool.writer() as cursor:
+            cursor.execute("BEGIN IMMEDIATE;")
+            for op, args in ops:
+                tx = Transaction(cursor)
+                cursor.execute("SAVEPOINT write_op;")
+                try:
+                    results.append(op(tx, *args))
+                except Exception as e:
+                    if is_busy(e):
+                        raise
+                    cursor.execute("ROLLBACK TO write_op;")
+                    results.append(e)
+                else:
+                    callbacks.extend(tx.callbacks)
+                cursor.execute("RELEASE write_op;")
+
+        # Caches only see changes that actually committed. The batch has
+        # committed either way, so a failing callback must not lose the
+        # results, the caches are rebuilt from the tables instead.
+        failed = False
+        for func, args in callbacks:
+            try:
+                func(*args)
+            except Exception:
+                self.callback_errors += 1
+                failed = True
+        if failed:
+            self.settings = GuildSettingsCache()
+            self.admins = AdminRoleCache()
+            self.selections = ReactionSelections()
+            self.reload_index()
+        return results
+
+    def add_reaction_role(self, rl_dict: dict):
+        return self.write(self._add_reaction_role, rl_dict)
+
+    def _add_reaction_role(self, tx, rl_dict):
+        cursor = tx.cursor
+        cursor.execute(
+            "SELECT 1 FROM messages WHERE message_id = ?;",
+            (rl_dict["message"]["message_id"],),
+        )
+        if cursor.fetchone():
+            raise DuplicateInstance("The message id is already in use!")
+        # reactionrole_id is the rowid, SQLite allocates it
+        cursor.execute(
+            "INSERT INTO 'messages' ('message_id', 'channel', 'guild_id',"
+            " 'limit_to_one') values(?, ?, ?, ?);",
+            (
+                rl_dict["message"]["message_id"],
+                rl_dict["message"]["channel_id"],
+                rl_dict["message"]["guild_id"],
+                rl_dict["limit_to_one"],
+            ),
+        )
+        reactionrole_id = cursor.lastrowid
+        combos = [
+            (reactionrole_id, reaction, role_id)
+            for reaction, role_id in rl_dict["reactions"].items()
+        ]
+        cursor.executemany(
+            "INSERT INTO 'reactionroles' ('reactionrole_id', 'reaction', 'role_id') values(?, ?, ?);",
+            combos,
+        )
+        tx.on_commit(self.managed.add, rl_dict["message"]["message_id"])
+        if self.index is not None:
+            tx.on_commit(
+                self.index.add,
+                rl_dict["message"]["message_id"],
+                reactionrole_id,
+                rl_dict["limit_to_one"],
+                rl_dict["message"]["guild_id"],
+                rl_dict["reactions"],
             )
-            conn.commit()
 
-            cursor.close()
-            conn.close()
+    def manages(self, message_id):
+        # May be true for a message deleted a moment ago, never false for
+        # one that is committed
+        return message_id in self.managed
+
+    def exists(self, message_id):
+        try:
+            with self.pool.reader() as cursor:
+                cursor.execute(
+                    "SELECT * FROM messages WHERE message_id = ?;", (message_id,)
+                )
+                return cursor.fetchall()
 
         except sqlite3.Error as e:
             return e
 
-    def delete(self, message_id, guild_id=None):
+    def get_reactions(self, message_id):
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            if guild_id:
+            with self.pool.reader() as cursor:
+                cursor.execute(
+                    "SELECT reactionrole_id FROM messages WHERE message_id = ?;",
+                    (message_id,),
+                )
+                reactionrole_id = cursor.fetchall()[0][0]
                 cursor.execute(
-                    "SELECT reactionrole_id FROM messages WHERE guild_id = ?;",
-                    (guild_id,),
+                    "SELECT reaction, role_id FROM reactionroles WHERE reactionrole_id"
+                    " = ?;",
+                    (reactionrole_id,),
                 )
+                combos = {}
+                for row in cursor:
+                    reaction = row[0]
+                    role_id = row[1]
+                    combos[reaction] = role_id
+
+                return combos
+
+        except sqlite3.Error as e:
+            return e
+
+    def get_reaction_config(self, message_id):
+        # Everything a reaction listener needs about a message in one lookup
+        if self.index is not None:
+            entry = self.index.get(message_id)
+            if entry is None:
+                return ReactionConfig(False, 0, None, {})
+            return ReactionConfig(
+                True, entry.limit_to_one, entry.guild_id, entry.reactions
+            )
 
-            else:
+        try:
+            with self.pool.reader() as cursor:
                 cursor.execute(
-                    "SELECT reactionrole_id FROM messages WHERE message_id = ?;",
+                    "SELECT messages.limit_to_one, messages.guild_id,"
+                    " reactionroles.reaction, reactionroles.role_id FROM messages"
+                    " LEFT JOIN reactionroles ON reactionroles.reactionrole_id"
+                    " = messages.reactionrole_id WHERE messages.message_id = ?;",
                     (message_id,),
                 )
+                rows = cursor.fetchall()
+            if not rows:
+                return ReactionConfig(False, 0, None, {})
 
-            result = cursor.fetchall()
-            if result:
-                reactionrole_id = result[0][0]
+            reactions = {
+                reaction: role_id
+                for _, _, reaction, role_id in rows
+                if reaction is not None
+            }
+            return ReactionConfig(True, rows[0][0], rows[0][1], reactions)
+
+        except sqlite3.Error as e:
+            return e
+
+    def isunique(self, message_id):
+        try:
+            with self.pool.reader() as cursor:
                 cursor.execute(
-                    "DELETE FROM messages WHERE reactionrole_id = ?;",
-                    (reactionrole_id,),
+                    "SELECT limit_to_one FROM messages WHERE message_id = ?;",
+                    (message_id,),
                 )
+                return cursor.fetchall()[0][0]
+
+        except sqlite3.Error as e:
+            return e
+
+    def fetch_messages(self, channel):
+        try:
+            with self.pool.reader() as cursor:
                 cursor.execute(
-                    "DELETE FROM reactionroles WHERE reactionrole_id = ?;",
-                    (reactionrole_id,),
+                    "SELECT message_id FROM messages WHERE channel = ?;", (
+                        channel,)
                 )
-                conn.commit()
+                all_messages_in_channel = []
+                for row in cursor:
+                    message_id = int(row[0])
+                    all_messages_in_channel.append(message_id)
 
-            cursor.close()
-            conn.close()
+                return all_messages_in_channel
 
         except sqlite3.Error as e:
             return e
 
-    def add_admin(self, role_id: int, guild_id: int):
+    def fetch_all_messages(self):
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
+            with self.pool.reader() as cursor:
+                cursor.execute("SELECT * FROM messages;")
+                return cursor.fetchall()
+
+        except sqlite3.Error as e:
+            return e
+
+    def iter_messages(self, chunk_size=CHUNK_SIZE):
+        """Yields every messages row in lists of at most ``chunk_size``.
+
+        Pages are keyed on reactionrole_id rather than OFFSET, so each one is
+        a rowid range lookup and rows deleted between pages are not skipped.
+        No read transaction is held between pages. A database error is
+        yielded in place of a chunk and ends the iteration.
+        """
+        last = None
+        while True:
+            try:
+                with self.pool.reader() as cursor:
+                    if last is None:
+                        cursor.execute(
+                            "SELECT message_id, channel, reactionrole_id, guild_id,"
+                            " limit_to_one FROM messages ORDER BY reactionrole_id"
+                            " LIMIT ?;",
+                            (chunk_size,),
+                        )
+                    else:
+                        cursor.execute(
+                            "SELECT message_id, channel, reactionrole_id, guild_id,"
+                            " limit_to_one FROM messages WHERE reactionrole_id > ?"
+                            " ORDER BY reactionrole_id LIMIT ?;",
+                            (last, chunk_size),
+                        )
+                    chunk = cursor.fetchall()
+
+            except sqlite3.Error as e:
+                yield e
+                return
+
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last = chunk[-1][2]
+
+    def add_guild(self, channel_id, guild_id):
+        return self.write(self._add_guild, channel_id, guild_id)
+
+    def _add_guild(self, tx, channel_id, guild_id):
+        cursor = tx.cursor
+        cursor.execute(
+            "SELECT message_id FROM messages WHERE channel = ?;", (channel_id,)
+        )
+        message_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "UPDATE messages SET guild_id = ? WHERE channel = ?;",
+            (guild_id, channel_id),
+        )
+        if self.index is not None:
+            for message_id in message_ids:
+                tx.on_commit(self.index.set_guild, message_id, guild_id)
+
+    def remove_guild(self, guild_id):
+        return self.write(self._remove_guild, guild_id)
+
+    def _remove_guild(self, tx, guild_id):
+        return self._remove_guilds(tx, [guild_id])
+
+    def remove_guilds(self, guild_ids):
+        # Purges every row of the given guilds in one transaction and
+        # returns how many rows were removed from each table
+        return self.write(self._remove_guilds, list(guild_ids))
+
+    def _remove_guilds(self, tx, guild_ids):
+        self._stage_guilds(tx.cursor, guild_ids)
+        return self._delete_staged(tx, guild_ids)
+
+    def _stage_guilds(self, cursor, guild_ids):
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS purge_guilds ('guild_id' INTEGER"
+            " PRIMARY KEY);"
+        )
+        cursor.execute("DELETE FROM purge_guilds;")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO purge_guilds ('guild_id') values(?);",
+            [(guild_id,) for guild_id in guild_ids],
+        )
+
+    def _delete_staged(self, tx, guild_ids):
+        # Removes every row of the guilds in purge_guilds
+        cursor = tx.cursor
+        cursor.execute(
+            "SELECT message_id FROM messages WHERE guild_id IN"
+            " (SELECT guild_id FROM purge_guilds);"
+        )
+        message_ids = [row[0] for row in cursor.fetchall()]
+
+        removed = {}
+        # The cascade would take these with the messages, deleting
+        # them first is what lets us count them
+        cursor.execute(
+            "DELETE FROM reactionroles WHERE reactionrole_id IN (SELECT"
+            " reactionrole_id FROM messages WHERE guild_id IN"
+            " (SELECT guild_id FROM purge_guilds));"
+        )
+        removed["reactionroles"] = cursor.rowcount
+        cursor.execute(
+            "DELETE FROM reaction_selections WHERE message_id IN (SELECT message_id"
+            " FROM messages WHERE guild_id IN (SELECT guild_id FROM purge_guilds));"
+        )
+        removed["reaction_selections"] = cursor.rowcount
+        for table in (
+            "messages",
+            "guild_settings",
+            "admins",
+            "cleanup_queue_guilds",
+        ):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE guild_id IN"
+                " (SELECT guild_id FROM purge_guilds);"
+            )
+            removed[table] = cursor.rowcount
+        cursor.execute("DELETE FROM purge_guilds;")
+
+        for guild_id in guild_ids:
+            tx.on_commit(self.settings.invalidate, guild_id)
+            tx.on_commit(self.admins.invalidate, guild_id)
+        for message_id in message_ids:
+            tx.on_commit(self.managed.discard, message_id)
+            tx.on_commit(self.selections.invalidate, message_id)
+            if self.index is not None:
+                tx.on_commit(self.index.discard, message_id)
+        return removed
+
+    def archive_guilds(self, guild_ids):
+        """Moves every row of the given guilds to the archive database,
+        returning how many rows left each table.
+
+        Without an archive the rows are purged like remove_guilds. Archiving a
+        guild again replaces what was archived for it before.
+        """
+        guild_ids = list(guild_ids)
+        copied = self.copy_to_archive(guild_ids)
+        if isinstance(copied, Exception):
+            return copied
+        return self.remove_guilds(guild_ids)
+
+    def copy_to_archive(self, guild_ids):
+        """Replaces what the archive holds for the given guilds with their
+        current rows.
+
+        Commits on its own, before the rows are removed from the main
+        database. SQLite only commits each WAL file atomically, so a crash in
+        between leaves the rows in both places instead of in neither, and
+        restore_guild skips messages that are still there.
+        """
+        return self.write(self._copy_to_archive, list(guild_ids))
+
+    def _copy_to_archive(self, tx, guild_ids):
+        if self.archive is None:
+            return
+
+        cursor = tx.cursor
+        self._stage_guilds(cursor, guild_ids)
+        cursor.execute(
+            "DELETE FROM archive.reactionroles WHERE archive_id IN (SELECT"
+            " archive_id FROM archive.messages WHERE guild_id IN (SELECT guild_id"
+            " FROM purge_guilds));"
+        )
+        for table in ("messages", "admins", "guild_settings"):
+            cursor.execute(
+                f"DELETE FROM archive.{table} WHERE guild_id IN"
+                " (SELECT guild_id FROM purge_guilds);"
+            )
+
+        # Only the rows copied below are matched up with their reactions
+        cursor.execute("SELECT COALESCE(MAX(archive_id), 0) FROM archive.messages;")
+        first_archive_id = cursor.fetchone()[0]
+        cursor.execute(
+            "INSERT INTO archive.messages ('message_id', 'channel',"
+            " 'reactionrole_id', 'guild_id', 'limit_to_one', 'archived_at') SELECT"
+            " message_id, channel, reactionrole_id, guild_id, limit_to_one, ? FROM"
+            " main.messages WHERE guild_id IN (SELECT guild_id FROM purge_guilds);",
+            (round(time.time()),),
+        )
+        cursor.execute(
+            "INSERT INTO archive.reactionroles ('archive_id', 'reaction', 'role_id')"
+            " SELECT archived.archive_id, reactionroles.reaction,"
+            " reactionroles.role_id FROM main.reactionroles JOIN archive.messages"
+            " AS archived ON archived.reactionrole_id = reactionroles.reactionrole_id"
+            " WHERE archived.archive_id > ?;",
+            (first_archive_id,),
+        )
+        cursor.execute(
+            "INSERT INTO archive.admins ('role_id', 'guild_id') SELECT role_id,"
+            " guild_id FROM main.admins WHERE guild_id IN (SELECT guild_id FROM"
+            " purge_guilds);"
+        )
+        cursor.execute(
+            "INSERT INTO archive.guild_settings ('guild_id', 'notify',"
+            " 'systemchannel') SELECT guild_id, notify, systemchannel FROM"
+            " main.guild_settings WHERE guild_id IN (SELECT guild_id FROM"
+            " purge_guilds);"
+        )
+        cursor.execute("DELETE FROM purge_guilds;")
+
+    def restore_guild(self, guild_id):
+        """Moves a guild's archived rows back into the hot tables.
+
+        Messages that were set up again in the meantime keep their current
+        configuration. Returns how many rows were restored per table.
+        """
+        return self.write(self._restore_guild, guild_id)
+
+    def _restore_guild(self, tx, guild_id):
+        if self.archive is None:
+            return {}
+
+        cursor = tx.cursor
+        cursor.execute(
+            "SELECT archive_id, message_id, channel, limit_to_one FROM"
+            " archive.messages WHERE guild_id = ?;",
+            (guild_id,),
+        )
+        archived = cursor.fetchall()
+        restored = {"messages": 0, "reactionroles": 0}
+        for archive_id, message_id, channel, limit_to_one in archived:
+            cursor.execute(
+                "SELECT 1 FROM main.messages WHERE message_id = ?;", (message_id,)
+            )
+            if cursor.fetchone():
+                continue
+
             cursor.execute(
-                "INSERT INTO 'admins' ('role_id', 'guild_id') values(?,?);",
-                (role_id, guild_id),
+                "INSERT INTO main.messages ('message_id', 'channel', 'guild_id',"
+                " 'limit_to_one') values(?, ?, ?, ?);",
+                (message_id, channel, guild_id, limit_to_one),
+            )
+            reactionrole_id = cursor.lastrowid
+            cursor.execute(
+                "SELECT reaction, role_id FROM archive.reactionroles WHERE"
+                " archive_id = ?;",
+                (archive_id,),
+            )
+            reactions = dict(cursor.fetchall())
+            cursor.executemany(
+                "INSERT INTO main.reactionroles ('reactionrole_id', 'reaction',"
+                " 'role_id') values(?, ?, ?);",
+                [
+                    (reactionrole_id, reaction, role_id)
+                    for reaction, role_id in reactions.items()
+                ],
+            )
+            restored["messages"] += 1
+            restored["reactionroles"] += len(reactions)
+            tx.on_commit(self.managed.add, message_id)
+            if self.index is not None:
+                tx.on_commit(
+                    self.index.add,
+                    message_id,
+                    reactionrole_id,
+                    limit_to_one,
+                    guild_id,
+                    reactions,
+                )
+
+        cursor.execute(
+            "INSERT INTO main.admins ('role_id', 'guild_id') SELECT role_id,"
+            " guild_id FROM archive.admins WHERE guild_id = ? AND role_id NOT IN"
+            " (SELECT role_id FROM main.admins WHERE guild_id = ?);",
+            (guild_id, guild_id),
+        )
+        restored["admins"] = cursor.rowcount
+        cursor.execute(
+            "INSERT OR IGNORE INTO main.guild_settings ('guild_id', 'notify',"
+            " 'systemchannel') SELECT guild_id, notify, systemchannel FROM"
+            " archive.guild_settings WHERE guild_id = ?;",
+            (guild_id,),
+        )
+        restored["guild_settings"] = cursor.rowcount
+
+        cursor.execute(
+            "DELETE FROM archive.reactionroles WHERE archive_id IN (SELECT"
+            " archive_id FROM archive.messages WHERE guild_id = ?);",
+            (guild_id,),
+        )
+        for table in ("messages", "admins", "guild_settings"):
+            cursor.execute(
+                f"DELETE FROM archive.{table} WHERE guild_id = ?;", (guild_id,)
             )
-            conn.commit()
-            cursor.close()
-            conn.close()
+
+        tx.on_commit(self.settings.invalidate, guild_id)
+        tx.on_commit(self.admins.invalidate, guild_id)
+        return restored
+
+    def delete(self, message_id):
+        return self.write(self._delete, message_id)
+
+    def _delete(self, tx, message_id):
+        # The reactionroles rows go with it through the cascade
+        tx.cursor.execute(
+            "DELETE FROM messages WHERE message_id = ?;", (message_id,))
+        tx.cursor.execute(
+            "DELETE FROM reaction_selections WHERE message_id = ?;", (message_id,)
+        )
+        tx.on_commit(self.managed.discard, message_id)
+        tx.on_commit(self.selections.invalidate, message_id)
+        if self.index is not None:
+            tx.on_commit(self.index.discard, message_id)
+
+    def reload_index(self):
+        # Rebuilds the managed message ids and the in-memory index from the
+        # tables
+        try:
+            managed = ManagedMessages()
+            index = ReactionRoleIndex() if self.index is not None else None
+            with self.pool.writer() as cursor:
+                managed.load(cursor)
+                # Kept even if the index cannot load on an old schema
+                self.managed = managed
+                self.selections_since = self._selections_since(cursor)
+                if index is not None:
+                    index.load(cursor)
+            if index is not None:
+                self.index = index
 
         except sqlite3.Error as e:
             return e
 
-    def remove_admin(self, role_id: int, guild_id: int):
+    def _selections_since(self, cursor):
+        cursor.execute("PRAGMA table_info(dbinfo);")
+        if "selections_since" not in [value[1] for value in cursor.fetchall()]:
+            return None
+        cursor.execute("SELECT MAX(selections_since) FROM dbinfo;")
+        return cursor.fetchone()[0]
+
+    def check_index(self):
+        # Diffs the in-memory index against a fresh read of the tables
+        if self.index is None:
+            return []
+
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM admins WHERE role_id = ? AND guild_id = ?;",
-                (role_id, guild_id),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
+            stored = ReactionRoleIndex()
+            with self.pool.writer() as cursor:
+                stored.load(cursor)
+            return self.index.diff(stored)
 
         except sqlite3.Error as e:
             return e
 
+    def add_admin(self, role_id: int, guild_id: int):
+        return self.write(self._add_admin, role_id, guild_id)
+
+    def _add_admin(self, tx, role_id, guild_id):
+        tx.cursor.execute(
+            "INSERT INTO 'admins' ('role_id', 'guild_id') values(?,?);",
+            (role_id, guild_id),
+        )
+        tx.on_commit(self.admins.invalidate, guild_id)
+
+    def remove_admin(self, role_id: int, guild_id: int):
+        return self.write(self._remove_admin, role_id, guild_id)
+
+    def _remove_admin(self, tx, role_id, guild_id):
+        tx.cursor.execute(
+            "DELETE FROM admins WHERE role_id = ? AND guild_id = ?;",
+            (role_id, guild_id),
+        )
+        tx.on_commit(self.admins.invalidate, guild_id)
+
     def get_admins(self, guild_id: int):
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM admins WHERE guild_id = ?;", (guild_id,))
-            admins = []
-            for row in cursor:
-                role_id = row[0]
-                admins.append(role_id)
+            with self.pool.reader() as cursor:
+                cursor.execute(
+                    "SELECT * FROM admins WHERE guild_id = ?;", (guild_id,))
+                admins = []
+                for row in cursor:
+                    role_id = row[0]
+                    admins.append(role_id)
 
-            cursor.close()
-            conn.close()
-            return admins
+                return admins
 
         except sqlite3.Error as e:
             return e
 
-    def add_systemchannel(self, guild_id, channel_id):
+    def admin_roles(self, guild_id: int):
+        # Cached frozenset of the guild's admin role ids
+        roles = self.admins.get(guild_id)
+        if roles is not None:
+            return roles
+
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            notify = 0
-            cursor.execute(
-                "INSERT OR IGNORE INTO guild_settings ('guild_id', 'notify', 'systemchannel')"
-                " values(?, ?, ?);",
-                (guild_id, notify, channel_id),
-            )
-            cursor.execute(
-                "UPDATE guild_settings SET systemchannel = ? WHERE guild_id = ?;",
-                (channel_id, guild_id),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with self.pool.reader() as cursor:
+                return self.admins.load(cursor, guild_id)
 
         except sqlite3.Error as e:
             return e
 
+    def add_systemchannel(self, guild_id, channel_id):
+        return self.write(self._add_systemchannel, guild_id, channel_id)
+
+    def _add_systemchannel(self, tx, guild_id, channel_id):
+        cursor = tx.cursor
+        notify = 0
+        cursor.execute(
+            "INSERT OR IGNORE INTO guild_settings ('guild_id', 'notify', 'systemchannel')"
+            " values(?, ?, ?);",
+            (guild_id, notify, channel_id),
+        )
+        cursor.execute(
+            "UPDATE guild_settings SET systemchannel = ? WHERE guild_id = ?;",
+            (channel_id, guild_id),
+        )
+        tx.on_commit(self.settings.invalidate, guild_id)
+
     def remove_systemchannel(self, guild_id):
+        return self.write(self._remove_systemchannel, guild_id)
+
+    def _remove_systemchannel(self, tx, guild_id):
+        channel_id = 0  # Set to false
+        self._add_systemchannel(tx, guild_id, channel_id)
+
+    def get_guild_settings(self, guild_id):
+        settings = self.settings.get(guild_id)
+        if settings is not None:
+            return settings
+
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            channel_id = 0  # Set to false
-            notify = 0
-            cursor.execute(
-                "INSERT OR IGNORE INTO guild_settings ('guild_id', 'notify', 'systemchannel')"
-                " values(?, ?);",
-                (guild_id, notify, channel_id),
-            )
-            cursor.execute(
-                "UPDATE guild_settings SET systemchannel = ? WHERE guild_id = ?;",
-                (channel_id, guild_id),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with self.pool.reader() as cursor:
+                return self.settings.load(cursor, guild_id)
 
         except sqlite3.Error as e:
             return e
 
     def fetch_systemchannel(self, guild_id):
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT systemchannel FROM guild_settings WHERE guild_id = ?;",
-                (guild_id,),
-            )
-            result = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            return result
+        # Returns the channel id, 0 if the guild has none set
+        settings = self.get_guild_settings(guild_id)
+        if isinstance(settings, Exception):
+            return settings
 
-        except sqlite3.Error as e:
-            return e
+        return settings.systemchannel
 
     def fetch_all_guilds(self):
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute("SELECT guild_id FROM messages;")
-            message_guilds = cursor.fetchall()
+            with self.pool.reader() as cursor:
+                cursor.execute("SELECT guild_id FROM messages;")
+                message_guilds = cursor.fetchall()
 
-            cursor.execute("SELECT guild_id FROM guild_settings;")
-            systemchannel_guilds = cursor.fetchall()
+                cursor.execute("SELECT guild_id FROM guild_settings;")
+                systemchannel_guilds = cursor.fetchall()
 
-            cursor.execute("SELECT guild_id FROM admins;")
-            admin_guilds = cursor.fetchall()
+                cursor.execute("SELECT guild_id FROM admins;")
+                admin_guilds = cursor.fetchall()
 
             guilds = message_guilds + systemchannel_guilds + admin_guilds
 
@@ -399,184 +978,216 @@ class Database:
                 if guild[0] is not None:
                     guild_ids.append(guild[0])
 
-            cursor.close()
-            conn.close()
             return guild_ids
 
         except sqlite3.Error as e:
             return e
 
-    def add_reaction(self, message_id, role_id, reaction):
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT reactionrole_id FROM messages WHERE message_id = ?;",
-                (message_id,),
-            )
-            reactionrole_id = cursor.fetchall()[0][0]
-            cursor.execute(
-                "SELECT * FROM reactionroles WHERE reactionrole_id = ? AND reaction = ?;",
-                (reactionrole_id, reaction),
-            )
-            exists = cursor.fetchall()
-            if exists:
-                cursor.close()
-                conn.close()
-                return False
+    def iter_guilds(self, chunk_size=CHUNK_SIZE):
+        # Distinct guild ids across messages, guild_settings and admins, paged
+        # and errors reported the same way as iter_messages
+        last = 0
+        while True:
+            try:
+                with self.pool.reader() as cursor:
+                    # The bound is repeated in every branch so each one is an
+                    # index range scan
+                    cursor.execute(
+                        "SELECT guild_id FROM messages WHERE guild_id > :last UNION"
+                        " SELECT guild_id FROM guild_settings WHERE guild_id > :last"
+                        " UNION SELECT guild_id FROM admins WHERE guild_id > :last"
+                        " ORDER BY guild_id LIMIT :limit;",
+                        {"last": last, "limit": chunk_size},
+                    )
+                    chunk = [row[0] for row in cursor]
 
-            cursor.execute(
-                "INSERT INTO reactionroles ('reactionrole_id', 'reaction', 'role_id')"
-                " values(?, ?, ?);",
-                (reactionrole_id, reaction, role_id),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return True
+            except sqlite3.Error as e:
+                yield e
+                return
 
-        except sqlite3.Error as e:
-            return e
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last = chunk[-1]
+
+    def add_reaction(self, message_id, role_id, reaction):
+        return self.write(self._add_reaction, message_id, role_id, reaction)
+
+    def _add_reaction(self, tx, message_id, role_id, reaction):
+        cursor = tx.cursor
+        cursor.execute(
+            "INSERT INTO reactionroles ('reactionrole_id', 'reaction', 'role_id')"
+            " SELECT reactionrole_id, ?, ? FROM messages WHERE message_id = ?"
+            " ON CONFLICT (reactionrole_id, reaction) DO NOTHING;",
+            (reaction, role_id, message_id),
+        )
+        added = cursor.rowcount > 0
+        if added and self.index is not None:
+            tx.on_commit(self.index.set_reaction, message_id, reaction, role_id)
+        return added
 
     def remove_reaction(self, message_id, reaction):
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT reactionrole_id FROM messages WHERE message_id = ?;",
-                (message_id,),
-            )
-            reactionrole_id = cursor.fetchall()[0][0]
+        return self.write(self._remove_reaction, message_id, reaction)
+
+    def _remove_reaction(self, tx, message_id, reaction):
+        tx.cursor.execute(
+            "DELETE FROM reactionroles WHERE reactionrole_id = (SELECT"
+            " reactionrole_id FROM messages WHERE message_id = ?) AND reaction = ?;",
+            (message_id, reaction),
+        )
+        if self.index is not None:
+            tx.on_commit(self.index.remove_reaction, message_id, reaction)
+
+    def get_selection(self, message_id, user_id):
+        # The reaction user_id has selected on a limit-to-one message, or None
+        selections = self.selections.get(message_id)
+        if selections is None:
+            try:
+                with self.pool.reader() as cursor:
+                    selections = self.selections.load(cursor, message_id)
+
+            except sqlite3.Error as e:
+                return e
+
+        return selections.get(user_id)
+
+    def selections_recorded(self, message_id):
+        # False for messages sent before five_to_six, a member may have
+        # selected a reaction on them that was never stored
+        if self.selections_since is None:
+            return True
+        return (message_id >> 22) + DISCORD_EPOCH >= self.selections_since * 1000
+
+    def set_selection(self, message_id, user_id, reaction):
+        return self.write(self._set_selection, message_id, user_id, reaction)
+
+    def _set_selection(self, tx, message_id, user_id, reaction):
+        # Returns the reaction it replaces, so a swap is one round trip
+        cursor = tx.cursor
+        cursor.execute(
+            "SELECT reaction FROM reaction_selections WHERE message_id = ? AND"
+            " user_id = ?;",
+            (message_id, user_id),
+        )
+        previous = cursor.fetchone()
+        cursor.execute(
+            "INSERT OR REPLACE INTO reaction_selections ('message_id', 'user_id',"
+            " 'reaction') values(?, ?, ?);",
+            (message_id, user_id, reaction),
+        )
+        tx.on_commit(self.selections.set, message_id, user_id, reaction)
+        return previous[0] if previous else None
+
+    def clear_selection(self, message_id, user_id, reaction):
+        return self.write(self._clear_selection, message_id, user_id, reaction)
+
+    def _clear_selection(self, tx, message_id, user_id, reaction):
+        # Only clears the selection if it is ``reaction``, returns what the
+        # selection was
+        cursor = tx.cursor
+        cursor.execute(
+            "SELECT reaction FROM reaction_selections WHERE message_id = ? AND"
+            " user_id = ?;",
+            (message_id, user_id),
+        )
+        selected = cursor.fetchone()
+        if selected is None:
+            return None
+
+        if selected[0] == reaction:
             cursor.execute(
-                "DELETE FROM reactionroles WHERE reactionrole_id = ? AND reaction = ?;",
-                (reactionrole_id, reaction),
+                "DELETE FROM reaction_selections WHERE message_id = ? AND user_id = ?;",
+                (message_id, user_id),
             )
-            conn.commit()
-            cursor.close()
-            conn.close()
-
-        except sqlite3.Error as e:
-            return e
+            tx.on_commit(self.selections.discard, message_id, user_id)
+        return selected[0]
 
     def add_cleanup_guild(self, guild_id: int, unix_timestamp: int):
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO 'cleanup_queue_guilds' ('guild_id', 'unix_timestamp') values(?,?);",
-                (guild_id, unix_timestamp),
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return True
+        return self.write(self._add_cleanup_guild, guild_id, unix_timestamp)
 
-        except sqlite3.Error as e:
-            return e
+    def _add_cleanup_guild(self, tx, guild_id, unix_timestamp):
+        tx.cursor.execute(
+            "INSERT INTO 'cleanup_queue_guilds' ('guild_id', 'unix_timestamp') values(?,?);",
+            (guild_id, unix_timestamp),
+        )
+        return True
 
     def remove_cleanup_guild(self, guild_id: int):
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM cleanup_queue_guilds WHERE guild_id=?;", (
-                    guild_id,)
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return True
+        return self.write(self._remove_cleanup_guild, guild_id)
 
-        except sqlite3.Error as e:
-            return e
+    def _remove_cleanup_guild(self, tx, guild_id):
+        tx.cursor.execute(
+            "DELETE FROM cleanup_queue_guilds WHERE guild_id=?;", (guild_id,)
+        )
+        return True
 
     def fetch_cleanup_guilds(self, guild_ids_only=False):
         try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            if guild_ids_only:
-                cursor.execute("SELECT guild_id FROM cleanup_queue_guilds;")
-                guilds = cursor.fetchall()
-                guild_ids = []
-                for guild in guilds:
-                    guild_ids.append(guild[0])
-                guilds = guild_ids
-            else:
-                cursor.execute("SELECT * FROM cleanup_queue_guilds;")
-                guilds = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            return guilds
+            with self.pool.reader() as cursor:
+                if guild_ids_only:
+                    cursor.execute("SELECT guild_id FROM cleanup_queue_guilds;")
+                    guilds = cursor.fetchall()
+                    guild_ids = []
+                    for guild in guilds:
+                        guild_ids.append(guild[0])
+                    guilds = guild_ids
+                else:
+                    cursor.execute("SELECT * FROM cleanup_queue_guilds;")
+                    guilds = cursor.fetchall()
+                return guilds
 
         except sqlite3.Error as e:
             return e
 
     def toggle_notify(self, guild_id: int):
+        return self.write(self._toggle_notify, guild_id)
+
+    def _toggle_notify(self, tx, guild_id):
         # SQLite doesn't support booleans
         # INTs are used: 1 = True, 0 = False
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
+        cursor = tx.cursor
+        cursor.execute(
+            "SELECT notify FROM guild_settings WHERE guild_id = ?", (guild_id,)
+        )
+        results = cursor.fetchall()
+        if not results:
+            # If the guild was not in the table because the command was never used before
+            notify = 1
+            systemchannel = 0
             cursor.execute(
-                "SELECT notify FROM guild_settings WHERE guild_id = ?", (
-                    guild_id,)
+                "INSERT INTO 'guild_settings' ('guild_id', 'systemchannel', 'notify')"
+                " values(?, ?, ?);",
+                (guild_id, systemchannel, notify),
             )
-            results = cursor.fetchall()
-            if not results:
-                # If the guild was not in the table because the command was never used before
-                notify = 1
-                systemchannel = 0
-                cursor.execute(
-                    "INSERT INTO 'guild_settings' ('guild_id', 'notify') values(?, ?, ?);",
-                    (guild_id, systemchannel, notify),
-                )
-            else:
-                notify = results[0][0]
-                if notify:
-                    notify = 0
-                    cursor.execute(
-                        "UPDATE guild_settings SET notify = ? WHERE guild_id = ?",
-                        (notify, guild_id),
-                    )
-
-                else:
-                    notify = 1
-                    cursor.execute(
-                        "UPDATE guild_settings SET notify = ? WHERE guild_id = ?",
-                        (notify, guild_id),
-                    )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return notify
-
-        except sqlite3.Error as e:
-            return e
+        else:
+            notify = 0 if results[0][0] else 1
+            cursor.execute(
+                "UPDATE guild_settings SET notify = ? WHERE guild_id = ?",
+                (notify, guild_id),
+            )
+        tx.on_commit(self.settings.invalidate, guild_id)
+        return notify
 
     def notify(self, guild_id: int):
         # SQLite doesn't support booleans
         # INTs are used: 1 = True, 0 = False
-        try:
-            conn = sqlite3.connect(self.database)
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT notify FROM guild_settings WHERE guild_id = ?", (
-                    guild_id,)
-            )
-            results = cursor.fetchall()
-            if not results:
-                # If the guild was not in the table because the command was never used before
-                notify = 0
-                systemchannel = 0
-                cursor.execute(
-                    "INSERT INTO 'guild_settings' ('guild_id', `systemchannel`, 'notify') values(?, ?, ?);",
-                    (guild_id, systemchannel, notify),
-                )
-            else:
-                notify = results[0][0]
-            cursor.close()
-            conn.close()
-            return notify
+        settings = self.get_guild_settings(guild_id)
+        if isinstance(settings, Exception):
+            return settings
 
-        except sqlite3.Error as e:
-            return e
+        return settings.notify
+
+
+def _check_mutations(cls):
+    # AsyncDatabase queues every mutation by its op, so a missing or renamed
+    # op would only fail once the command is used
+    missing = sorted(
+        name for name in cls.mutations if not callable(getattr(cls, f"_{name}", None))
+    )
+    if missing:
+        raise TypeError(f"{cls.__name__} has no op for {', '.join(missing)}")
+
+
+_check_mutations(Database)
@@ -0,0 +1,58 @@
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+class InstanceLock:
+    """Exclusive lock on ``<database>.lock`` while the bot has the database
+    open.
+
+    The bot keeps its caches in memory, so the maintenance commands that
+    write take the lock too and refuse to run next to it. The OS drops the
+    lock when the process exits, a crashed bot never leaves it behind. The
+    file holds the pid of the owner.
+    """
+
+    def __init__(self, database):
+        self.path = f"{database}.lock"
+        self._file = None
+
+    @property
+    def owner(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def acquire(self):
+        # Returns False right away if another process holds the lock
+        file = open(self.path, "a+", encoding="utf-8")
+        try:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            file.close()
+            return False
+
+        file.truncate(0)
+        file.write(str(os.getpid()))
+        file.flush()
+        self._file = file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        # The file stays, removing it would race a process about to lock it
+        self._file.truncate(0)
+        self._file.close()
+        self._file = None
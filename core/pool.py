@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Applied to every connection the pool opens. WAL lets the readers keep
+# working while the writer commits, NORMAL is durable enough for WAL and
+# the cache/mmap sizes keep the hot tables resident between calls.
+# foreign_keys is needed for the reactionroles cascade.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -8000;",
+    "PRAGMA mmap_size = 67108864;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA busy_timeout = 5000;",
+    "PRAGMA foreign_keys = ON;",
+)
+
+# SQLite's default: checkpoint whenever the WAL passes 1000 pages
+WAL_AUTOCHECKPOINT = 1000
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections shared by every Database method.
+
+    There is a single writer connection, serialised by a lock, and one
+    query_only reader connection per thread that touches the database. In
+    WAL mode readers never wait for the writer, not even during a long
+    purge. Connections are opened lazily and kept until close() is called.
+
+    The writer checkpoints every ``wal_autocheckpoint`` pages. Passing 0
+    turns that off, in which case the owner calls checkpoint() itself so the
+    copy back into the database file happens off the write path.
+
+    ``attach`` maps schema names to further database files that every
+    connection attaches, also in WAL mode.
+    """
+
+    def __init__(self, database, wal_autocheckpoint=WAL_AUTOCHECKPOINT, attach=None):
+        self.database = database
+        self.wal_autocheckpoint = wal_autocheckpoint
+        self.attach = dict(attach or {})
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = None
+        self._checkpoint_lock = threading.Lock()
+        self._checkpointer = None
+
+    def connect(self, *pragmas):
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        # Attached first, journal_mode without a schema name covers them too
+        for schema, path in self.attach.items():
+            conn.execute(f"ATTACH DATABASE ? AS {schema};", (path,))
+        for pragma in PRAGMAS + pragmas:
+            conn.execute(pragma)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def reader(self):
+        conn = getattr(self._local, "reader", None)
+        if conn is None:
+            conn = self._local.reader = self.connect("PRAGMA query_only = ON;")
+
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def writer(self):
+        # Commits when the block exits cleanly, rolls back otherwise
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self.connect(
+                    f"PRAGMA wal_autocheckpoint = {int(self.wal_autocheckpoint)};"
+                )
+
+            cursor = self._writer.cursor()
+            try:
+                yield cursor
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def checkpoint(self, mode="PASSIVE"):
+        # Runs on a connection of its own so it neither holds the write lock
+        # nor the writer's cursor. Returns (busy, wal pages, checkpointed).
+        with self._checkpoint_lock:
+            if self._checkpointer is None:
+                self._checkpointer = self.connect()
+            return self._checkpointer.execute(
+                f"PRAGMA wal_checkpoint({mode});"
+            ).fetchone()
+
+    def close(self):
+        with self._write_lock, self._checkpoint_lock, self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._writer = None
+            self._checkpointer = None
+            self._local = threading.local()
@@ -1,21 +1,53 @@
 import sqlite3
+import time
 
-import discord
+LATEST_VERSION = 6
 
 
 class SchemaHandler:
+    """Brings reactionlight.db up to LATEST_VERSION.
+
+    All work happens on a single connection. Each step runs in its own
+    transaction together with the dbinfo version bump, so a crash leaves
+    the database at the previous version instead of half-migrated. How long
+    every step took is recorded in ``timings``.
+    """
+
+    # version -> (step, whether it needs the client's guild cache)
+    steps = {
+        0: ("zero_to_one", True),
+        1: ("one_to_two", True),
+        2: ("two_to_three", False),
+        3: ("three_to_four", False),
+        4: ("four_to_five", False),
+        5: ("five_to_six", False),
+    }
+
     def __init__(self, database, client):
         self.database = database
         self.client = client
+        self.timings = {}
+        # What the gateway steps need from the guild cache, see load_gateway
+        self.channel_guilds = {}
+        self.guild_roles = {}
+        self.gateway_loaded = False
+        # Channels zero_to_one could not map to a guild
+        self.unresolved_channels = []
+        # Transactions are managed explicitly with BEGIN/COMMIT. The bot opens
+        # the handler on the event loop and migrates in a thread.
+        self.conn = sqlite3.connect(
+            self.database, isolation_level=None, check_same_thread=False
+        )
         self.version = self.version_check()
 
+    def close(self):
+        self.conn.close()
+
     def version_check(self):
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+        cursor = self.conn.cursor()
         cursor.execute("SELECT version FROM dbinfo;")
         version = cursor.fetchall()
         cursor.close()
-        conn.close()
         if not version:
             self.set_version(0)
             return 0
@@ -23,9 +55,10 @@ class SchemaHandler:
         version = version[0][0]
         return version
 
-    def set_version(self, version):
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+    def set_version(self, version, cursor=None):
+        own_cursor = cursor is None
+        if own_cursor:
+            cursor = self.conn.cursor()
         if version > 0:
             previous = version - 1
             cursor.execute(
@@ -37,56 +70,151 @@ class SchemaHandler:
             cursor.execute(
                 "INSERT INTO dbinfo(version) values(?);", (version,))
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+        if own_cursor:
+            cursor.close()
         self.version = version
 
-    def zero_to_one(self):
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+    def load_gateway(self):
+        """Copies the channel and role ids of the client's guilds.
+
+        The guild cache belongs to the event loop, so the bot calls this there
+        and can then run migrate() in a thread.
+        """
+        self.channel_guilds = {
+            channel.id: guild.id
+            for guild in self.client.guilds
+            for channel in guild.channels
+        }
+        self.guild_roles = {
+            guild.id: {role.id for role in guild.roles} for guild in self.client.guilds
+        }
+        self.gateway_loaded = True
+
+    def needs_backfill(self, name):
+        # Whether a gateway step has rows to map to guilds, on a fresh file
+        # it can run without the guild cache
+        cursor = self.conn.cursor()
+        try:
+            if name == "zero_to_one":
+                cursor.execute("PRAGMA table_info(messages);")
+                if "guild_id" in [value[1] for value in cursor.fetchall()]:
+                    cursor.execute(
+                        "SELECT 1 FROM messages WHERE guild_id IS NULL LIMIT 1;"
+                    )
+                else:
+                    cursor.execute("SELECT 1 FROM messages LIMIT 1;")
+            else:
+                cursor.execute("PRAGMA table_info(admins);")
+                if "guild_id" in [value[1] for value in cursor.fetchall()]:
+                    return False
+                cursor.execute("SELECT 1 FROM admins LIMIT 1;")
+            return cursor.fetchone() is not None
+        finally:
+            cursor.close()
+
+    def pending(self):
+        return [
+            self.steps[version][0]
+            for version in range(self.version, LATEST_VERSION)
+        ]
+
+    def migrate(self, gateway=True, until=LATEST_VERSION):
+        """Applies every pending step up to ``until``.
+
+        Steps that need the guild cache are left for a later call when
+        ``gateway`` is False, unless they have no rows to backfill. Returns
+        True once nothing is left to apply.
+        """
+        while self.version < until:
+            name, needs_gateway = self.steps[self.version]
+            if needs_gateway:
+                if not gateway:
+                    if self.needs_backfill(name):
+                        return False
+                elif not self.gateway_loaded and self.client is not None:
+                    self.load_gateway()
+
+            self.apply(name, self.version + 1)
+
+        return self.version >= LATEST_VERSION
+
+    def apply(self, name, version):
+        cursor = self.conn.cursor()
+        start = time.perf_counter()
+        cursor.execute("BEGIN IMMEDIATE;")
+        try:
+            getattr(self, name)(cursor)
+            self.set_version(version, cursor)
+            cursor.execute("COMMIT;")
+        except BaseException:
+            cursor.execute("ROLLBACK;")
+            self.version = version - 1
+            raise
+        finally:
+            cursor.close()
+
+        self.timings[name] = time.perf_counter() - start
+
+    def zero_to_one(self, cursor):
         cursor.execute("PRAGMA table_info(messages);")
         result = cursor.fetchall()
         columns = [value[1] for value in result]
         if "guild_id" not in columns:
             cursor.execute("ALTER TABLE messages ADD COLUMN 'guild_id' INT;")
-            conn.commit()
 
-        cursor.close()
-        conn.close()
-        self.set_version(1)
+        # Backfill guild_id from the gateway cache: the channel map is applied
+        # with a single UPDATE through a temp table, since messages.channel
+        # has no index at this version
+        channel_guilds = self.channel_guilds
+        cursor.execute(
+            "SELECT DISTINCT channel FROM messages WHERE guild_id IS NULL;")
+        channels = [row[0] for row in cursor.fetchall()]
+        self.unresolved_channels = [
+            channel for channel in channels if channel not in channel_guilds
+        ]
+
+        cursor.execute(
+            "CREATE TEMP TABLE backfill_guilds ('channel' INTEGER PRIMARY KEY,"
+            " 'guild_id' INT);"
+        )
+        cursor.executemany(
+            "INSERT INTO backfill_guilds ('channel', 'guild_id') values(?, ?);",
+            [
+                (channel, channel_guilds[channel])
+                for channel in channels
+                if channel in channel_guilds
+            ],
+        )
+        cursor.execute(
+            "UPDATE messages SET guild_id = (SELECT guild_id FROM backfill_guilds"
+            " WHERE backfill_guilds.channel = messages.channel) WHERE guild_id IS NULL"
+            " AND channel IN (SELECT channel FROM backfill_guilds);"
+        )
+        cursor.execute("DROP TABLE backfill_guilds;")
 
-    def one_to_two(self):
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+    def one_to_two(self, cursor):
         cursor.execute("PRAGMA table_info(admins);")
         result = cursor.fetchall()
         columns = [value[1] for value in result]
         if "guild_id" not in columns:
             cursor.execute("SELECT role_id FROM admins")
-            admins = cursor.fetchall()
-            admins2 = []
-            for admin in admins:
-                admins2.append(admin[0])
-            admins = admins2
-            guilds = {}
-            for guild in self.client.guilds:
-                guilds[guild.id] = []
-                for admin_id in admins:
-                    role = discord.utils.get(guild.roles, id=admin_id)
-                    if role is not None:
-                        guilds[guild.id].append(role.id)
+            admins = {admin[0] for admin in cursor.fetchall()}
+            # One set per guild instead of a lookup per admin role
+            guilds = {
+                guild_id: admins & role_ids
+                for guild_id, role_ids in self.guild_roles.items()
+            }
 
             cursor.execute("ALTER TABLE admins ADD COLUMN 'guild_id' INT;")
-            conn.commit()
-            for guild in guilds:
-                for admin_id in guilds[guild]:
-                    cursor.execute(
-                        "UPDATE admins SET guild_id = ? WHERE role_id = ?;",
-                        (guild, admin_id),
-                    )
+            cursor.executemany(
+                "UPDATE admins SET guild_id = ? WHERE role_id = ?;",
+                [
+                    (guild_id, admin_id)
+                    for guild_id, admin_ids in guilds.items()
+                    for admin_id in admin_ids
+                ],
+            )
             cursor.execute("DELETE FROM admins WHERE guild_id IS NULL;")
-            conn.commit()
 
         cursor.execute(
             "SELECT name FROM sqlite_master WHERE type='table' AND name='systemchannels';"
@@ -95,24 +223,14 @@ class SchemaHandler:
         if systemchannels_table:
             cursor.execute("SELECT * FROM systemchannels;")
             entries = cursor.fetchall()
-            for entry in entries:
-                guild_id = entry[0]
-                channel_id = entry[1]
-                notify = 0  # Set default to not notify
-                cursor.execute(
-                    "INSERT INTO guild_settings ('guild_id', 'notify', 'systemchannel') values(?, ?, ?);",
-                    (guild_id, notify, channel_id),
-                )
+            notify = 0  # Set default to not notify
+            cursor.executemany(
+                "INSERT INTO guild_settings ('guild_id', 'notify', 'systemchannel') values(?, ?, ?);",
+                [(entry[0], notify, entry[1]) for entry in entries],
+            )
             cursor.execute("DROP TABLE systemchannels;")
-            conn.commit()
-
-        cursor.close()
-        conn.close()
-        self.set_version(2)
 
-    def two_to_three(self):
-        conn = sqlite3.connect(self.database)
-        cursor = conn.cursor()
+    def two_to_three(self, cursor):
         cursor.execute("PRAGMA table_info(messages);")
         result = cursor.fetchall()
         columns = [value[1] for value in result]
@@ -122,8 +240,96 @@ class SchemaHandler:
             cursor.execute(
                 "UPDATE messages SET limit_to_one = 0 WHERE limit_to_one IS NULL;"
             )
-            conn.commit()
 
-        cursor.close()
-        conn.close()
-        self.set_version(3)
+    def three_to_four(self, cursor):
+        # Covering indexes for every lookup Database makes, so none of them
+        # has to scan a table or go back to the row
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS messages_message_id_idx ON messages"
+            " (message_id, reactionrole_id, limit_to_one, guild_id);"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS messages_channel_idx ON messages"
+            " (channel, message_id);"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS messages_guild_id_idx ON messages"
+            " (guild_id, reactionrole_id, message_id);"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS reactionroles_reactionrole_id_idx ON"
+            " reactionroles (reactionrole_id, reaction, role_id);"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS admins_guild_id_idx ON admins"
+            " (guild_id, role_id);"
+        )
+        cursor.execute("ANALYZE;")
+
+    def four_to_five(self, cursor):
+        cursor.execute("PRAGMA table_info(messages);")
+        result = cursor.fetchall()
+        # Column 5 of table_info is the primary key flag
+        primary_keys = [value[1] for value in result if value[5]]
+        if "reactionrole_id" not in primary_keys:
+            # SQLite cannot add keys to an existing table, so both tables are
+            # rebuilt. The old random ids are unique and are kept as rowids.
+            cursor.execute(
+                "CREATE TABLE messages_new ('message_id' INT, 'channel' INT,"
+                " 'reactionrole_id' INTEGER PRIMARY KEY, 'guild_id' INT,"
+                " 'limit_to_one' INT);"
+            )
+            cursor.execute(
+                "INSERT INTO messages_new ('message_id', 'channel', 'reactionrole_id',"
+                " 'guild_id', 'limit_to_one') SELECT message_id, channel,"
+                " reactionrole_id, guild_id, limit_to_one FROM messages;"
+            )
+            cursor.execute(
+                "CREATE TABLE reactionroles_new ('reactionrole_id' INTEGER NOT NULL"
+                " REFERENCES messages (reactionrole_id) ON DELETE CASCADE, 'reaction'"
+                " NVCARCHAR NOT NULL, 'role_id' INT, UNIQUE (reactionrole_id, reaction));"
+            )
+            # Orphaned rows and duplicate reactions are dropped on the way
+            cursor.execute(
+                "INSERT OR IGNORE INTO reactionroles_new ('reactionrole_id', 'reaction',"
+                " 'role_id') SELECT reactionrole_id, reaction, role_id FROM reactionroles"
+                " WHERE reaction IS NOT NULL AND reactionrole_id IN"
+                " (SELECT reactionrole_id FROM messages_new);"
+            )
+            cursor.execute("DROP TABLE reactionroles;")
+            cursor.execute("DROP TABLE messages;")
+            cursor.execute("ALTER TABLE messages_new RENAME TO messages;")
+            cursor.execute(
+                "ALTER TABLE reactionroles_new RENAME TO reactionroles;")
+            # The v4 indexes were dropped with the old tables
+            cursor.execute(
+                "CREATE INDEX messages_message_id_idx ON messages"
+                " (message_id, reactionrole_id, limit_to_one, guild_id);"
+            )
+            cursor.execute(
+                "CREATE INDEX messages_channel_idx ON messages (channel, message_id);"
+            )
+            cursor.execute(
+                "CREATE INDEX messages_guild_id_idx ON messages"
+                " (guild_id, reactionrole_id, message_id);"
+            )
+            cursor.execute(
+                "CREATE INDEX reactionroles_reactionrole_id_idx ON reactionroles"
+                " (reactionrole_id, reaction, role_id);"
+            )
+            cursor.execute("ANALYZE;")
+
+    def five_to_six(self, cursor):
+        # The reaction each user has selected on limit-to-one messages, it
+        # starts out empty since Discord is the only record of older ones
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS reaction_selections ('message_id' INT NOT"
+            " NULL, 'user_id' INT NOT NULL, 'reaction' NVCARCHAR NOT NULL, PRIMARY"
+            " KEY (message_id, user_id)) WITHOUT ROWID;"
+        )
+        # Messages sent before now can have selections only Discord knows
+        # about, see Database.selections_recorded
+        cursor.execute("PRAGMA table_info(dbinfo);")
+        if "selections_since" not in [value[1] for value in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE dbinfo ADD COLUMN 'selections_since' INT;")
+        cursor.execute("UPDATE dbinfo SET selections_since = ?;", (round(time.time()),))
@@ -1 +1,2 @@
 from .classes import *
+from .checks import *
@@ -0,0 +1,37 @@
+from discord.ext import commands
+
+
+def has_admin_role(member, admin_roles):
+    # member._roles is a sorted SnowflakeList, so walk whichever side is smaller
+    roles = getattr(member, "_roles", None)
+    if roles is None:
+        # 'fake' users, such as webhooks, have no roles
+        return False
+
+    if len(admin_roles) < len(roles):
+        return any(roles.has(role_id) for role_id in admin_roles)
+    return any(role_id in admin_roles for role_id in roles)
+
+
+class NotReactionAdmin(commands.CheckFailure):
+    pass
+
+
+def is_reaction_admin():
+    """Passes when the author has a role that was added with the admin command,
+    raises NotReactionAdmin otherwise."""
+
+    async def predicate(ctx):
+        if ctx.guild is None:
+            raise NotReactionAdmin("Reaction-role commands only work in servers.")
+
+        admin_roles = await ctx.bot.db.admin_roles(ctx.guild.id)
+        if isinstance(admin_roles, Exception):
+            print(f"Error when checking if the member is an admin:\n{admin_roles}")
+            raise NotReactionAdmin("The admin roles could not be read.")
+
+        if not has_admin_role(ctx.author, admin_roles):
+            raise NotReactionAdmin("The author has no admin role.")
+        return True
+
+    return commands.check(predicate)
@@ -1,2 +1,5 @@
+from .locks import *
 from .paginator import *
+from .roles import *
+from .scheduler import *
 from .select_help import *
@@ -0,0 +1,82 @@
+import asyncio
+import contextlib
+import time
+
+
+class _Entry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Tasks holding or waiting for the lock
+        self.refs = 0
+
+
+class KeyedLock:
+    """asyncio locks per key, such as (guild_id, user_id), created on first use
+    and dropped as soon as no task holds or waits for them.
+
+    Everything runs on the event loop, so creating a lock needs no lock of
+    its own and unrelated keys never wait on each other. Only keys in use
+    take memory, however many have been seen.
+
+        async with locks.hold(guild_id, user_id):
+            ...
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.peak = 0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def locked(self, *key):
+        entry = self._entries.get(key)
+        return entry is not None and entry.lock.locked()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, *key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+            self.peak = max(self.peak, len(self._entries))
+
+        entry.refs += 1
+        try:
+            if entry.lock.locked():
+                self.contended += 1
+                start = time.perf_counter()
+                await entry.lock.acquire()
+                waited = time.perf_counter() - start
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+            else:
+                await entry.lock.acquire()
+
+            self.acquisitions += 1
+            try:
+                yield
+            finally:
+                entry.lock.release()
+
+        finally:
+            entry.refs -= 1
+            if not entry.refs:
+                del self._entries[key]
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "peak": self.peak,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": self.wait_time / self.contended * 1e3
+            if self.contended
+            else 0.0,
+            "max_wait_ms": self.max_wait * 1e3,
+        }
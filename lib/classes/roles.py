@@ -0,0 +1,159 @@
+import asyncio
+
+from .locks import KeyedLock
+
+
+class _Batch:
+    __slots__ = ("member", "changes", "futures")
+
+    def __init__(self, member):
+        self.member = member
+        # role_id -> (role, whether to add it), the last request wins
+        self.changes = {}
+        self.futures = []
+
+
+class RoleCoalescer:
+    """Collects the role changes of each member for ``delay`` seconds and
+    applies what is left of them with a single member.edit(roles=...).
+
+    add() and remove() return a future that resolves to True once the change
+    is part of the member's roles, or to False if a later change undid it or
+    the member already was in that state, in which case no request is made
+    for it at all. Errors of the edit, such as discord.Forbidden, are set on
+    the future.
+
+    Every edit starts from the member's current roles, so changes others
+    make are kept. The gateway's copy of a member lags behind an edit
+    though, so for ``settle`` seconds after one the changes it made are
+    applied on top of them again.
+
+    Edits go through ``scheduler``, a RoleScheduler, when one is given. A
+    member's changes keep merging into one batch while the previous edit
+    waits for its turn there.
+    """
+
+    def __init__(self, delay=0.5, settle=5.0, scheduler=None):
+        self.delay = delay
+        self.settle = settle
+        self.scheduler = scheduler
+        self._batches = {}
+        self._applied = {}
+        # The loop only keeps weak references to tasks
+        self._tasks = set()
+        # Edits of a member are applied one at a time, in order
+        self._locks = KeyedLock()
+
+        self.requested = 0
+        self.edits = 0
+        self.dropped = 0
+        # Changes whose future has not resolved yet
+        self.waiting = 0
+        self.peak_waiting = 0
+
+    def __len__(self):
+        return len(self._batches)
+
+    def add(self, member, role):
+        return self._submit(member, role, True)
+
+    def remove(self, member, role):
+        return self._submit(member, role, False)
+
+    def _submit(self, member, role, add):
+        loop = asyncio.get_running_loop()
+        key = (member.guild.id, member.id)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(member)
+            task = loop.create_task(self._flush(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        # The latest member object has the latest roles
+        batch.member = member
+        batch.changes[role.id] = (role, add)
+        future = loop.create_future()
+        future.add_done_callback(self._resolved)
+        batch.futures.append((future, role.id, add))
+        self.requested += 1
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        return future
+
+    def _resolved(self, future):
+        self.waiting -= 1
+
+    def _roles(self, key, member):
+        # roles[0] is @everyone, which edit() does not take
+        roles = {role.id: role for role in member.roles[1:]}
+        applied = self._applied.get(key)
+        if applied is not None and applied[1] > asyncio.get_running_loop().time():
+            for role_id, (role, add) in applied[0].items():
+                if add:
+                    roles[role_id] = role
+                else:
+                    roles.pop(role_id, None)
+        return roles
+
+    def _expire(self, key, expires):
+        applied = self._applied.get(key)
+        if applied is not None and applied[1] == expires:
+            del self._applied[key]
+
+    async def _flush(self, key):
+        await asyncio.sleep(self.delay)
+        async with self._locks.hold(*key):
+            batch = self._batches.pop(key)
+            roles = self._roles(key, batch.member)
+            before = set(roles)
+            for role_id, (role, add) in batch.changes.items():
+                if add:
+                    roles[role_id] = role
+                else:
+                    roles.pop(role_id, None)
+
+            try:
+                if set(roles) != before:
+                    self.edits += 1
+                    if self.scheduler is not None:
+                        await self.scheduler.submit(
+                            key[0], batch.member.edit, roles=list(roles.values())
+                        )
+                    else:
+                        await batch.member.edit(roles=list(roles.values()))
+                    # Only this batch's own changes, on top of the earlier
+                    # ones still settling
+                    loop = asyncio.get_running_loop()
+                    applied = self._applied.get(key)
+                    changes = {}
+                    if applied is not None and applied[1] > loop.time():
+                        changes.update(applied[0])
+                    changes.update(batch.changes)
+                    expires = loop.time() + self.settle
+                    self._applied[key] = (changes, expires)
+                    loop.call_later(self.settle, self._expire, key, expires)
+
+            except Exception as e:
+                for future, _, _ in batch.futures:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        for future, role_id, add in batch.futures:
+            final = batch.changes[role_id][1]
+            changed = add == final and (role_id in before) != final
+            if not changed:
+                self.dropped += 1
+            if not future.done():
+                future.set_result(changed)
+
+    def stats(self):
+        return {
+            "pending": len(self._batches),
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "requested": self.requested,
+            "edits": self.edits,
+            "dropped": self.dropped,
+        }
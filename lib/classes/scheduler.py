@@ -0,0 +1,171 @@
+import asyncio
+import collections
+import contextlib
+import functools
+
+
+class _Guild:
+    __slots__ = ("jobs", "running", "waiting", "ready", "space")
+
+    def __init__(self, max_queue):
+        self.jobs = collections.deque()
+        self.running = 0
+        # Tasks waiting in submit() for room in the queue
+        self.waiting = 0
+        # Whether the guild is in the round-robin ring
+        self.ready = False
+        self.space = asyncio.Semaphore(max_queue)
+
+
+class _Admission:
+    __slots__ = ("slots", "refs")
+
+    def __init__(self, max_pending):
+        self.slots = asyncio.Semaphore(max_pending)
+        # Events holding or waiting for a slot
+        self.refs = 0
+
+
+class RoleScheduler:
+    """Runs role changes with at most ``concurrency`` in flight, taking turns
+    between guilds so a burst in one guild cannot starve the others.
+
+    Every guild has a FIFO queue of at most ``max_queue`` jobs and at most
+    ``per_guild`` of them running, which keeps one guild's rate limit from
+    holding every slot. submit() waits while its guild's queue is full.
+
+    Events that lead to jobs are admitted first, at most ``max_pending`` per
+    guild at a time. The others wait at admit() before taking locks or
+    queueing changes, so a burst costs a parked task per event and nothing
+    more.
+
+        async with scheduler.admit(guild_id):
+            ...  # handle the event, waiting for its role changes
+
+        await scheduler.submit(guild_id, member.edit, roles=roles)
+    """
+
+    def __init__(self, concurrency=8, per_guild=2, max_queue=100, max_pending=100):
+        self.concurrency = concurrency
+        self.per_guild = per_guild
+        self.max_queue = max_queue
+        self.max_pending = max_pending
+        self._guilds = {}
+        self._admissions = {}
+        self._ring = collections.deque()
+        self._running = 0
+        self._tasks = set()
+
+        self.admitted = 0
+        self.held_back = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self):
+        return sum(len(guild.jobs) for guild in self._guilds.values())
+
+    def guild_depth(self, guild_id):
+        guild = self._guilds.get(guild_id)
+        return len(guild.jobs) if guild is not None else 0
+
+    @contextlib.asynccontextmanager
+    async def admit(self, guild_id):
+        admission = self._admissions.get(guild_id)
+        if admission is None:
+            admission = self._admissions[guild_id] = _Admission(self.max_pending)
+
+        admission.refs += 1
+        try:
+            if admission.slots.locked():
+                self.held_back += 1
+            async with admission.slots:
+                self.admitted += 1
+                yield
+        finally:
+            admission.refs -= 1
+            if not admission.refs:
+                del self._admissions[guild_id]
+
+    async def submit(self, guild_id, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            guild = self._guilds[guild_id] = _Guild(self.max_queue)
+
+        guild.waiting += 1
+        try:
+            await guild.space.acquire()
+        finally:
+            guild.waiting -= 1
+
+        future = loop.create_future()
+        guild.jobs.append(
+            (functools.partial(func, *args, **kwargs), future, loop.time())
+        )
+        self.submitted += 1
+        self._mark_ready(guild_id, guild)
+        self._pump()
+        return await future
+
+    def _mark_ready(self, guild_id, guild):
+        if not guild.ready and guild.jobs and guild.running < self.per_guild:
+            guild.ready = True
+            self._ring.append(guild_id)
+
+    def _pump(self):
+        loop = asyncio.get_running_loop()
+        while self._running < self.concurrency and self._ring:
+            guild_id = self._ring.popleft()
+            guild = self._guilds[guild_id]
+            guild.ready = False
+            job, future, enqueued = guild.jobs.popleft()
+            guild.space.release()
+            guild.running += 1
+            self._running += 1
+            # Back of the ring, so every other ready guild goes first
+            self._mark_ready(guild_id, guild)
+
+            waited = loop.time() - enqueued
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+            task = loop.create_task(self._run(guild_id, guild, job, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, guild_id, guild, job, future):
+        try:
+            result = await job()
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(result)
+        finally:
+            guild.running -= 1
+            self._running -= 1
+            self._mark_ready(guild_id, guild)
+            if not (guild.jobs or guild.running or guild.waiting):
+                del self._guilds[guild_id]
+            self._pump()
+
+    def stats(self):
+        started = self.completed + self.failed + self._running
+        return {
+            "depth": self.depth,
+            "guilds": len(self._guilds),
+            "admitted": self.admitted,
+            "held_back": self.held_back,
+            "running": self._running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": self.wait_time / started * 1e3 if started else 0.0,
+            "max_wait_ms": self.max_wait * 1e3,
+        }